@@ -0,0 +1,133 @@
+import zmq
+from zmq.eventloop import ioloop, zmqstream
+from tornado import gen
+from tornado.concurrent import Future
+
+from enums import SendStatus
+from node_signals_manager import NodeSignalsManager
+from node_socket_worker import NodeSocketWorker, create_node_socket, unpack_frames
+from rnode import RNode
+
+class StreamSocketWorker(object):
+    MESSAGE_ASSIGNMENT_COMMAND = NodeSocketWorker.MESSAGE_ASSIGNMENT_COMMAND
+    MESSAGE_ASSIGNMENT_MESSANGER = NodeSocketWorker.MESSAGE_ASSIGNMENT_MESSANGER
+
+    def __init__(self, identity,
+                 main_tcp_endpoint,
+                 cmd_endpoint,
+                 context, io_loop,
+                 zero_copy=False):
+        self._identity = identity
+        self._io_loop = io_loop
+        self._zero_copy = zero_copy
+
+        self.main_tcp_endpoint = main_tcp_endpoint
+        self._main_tcp_stream = zmqstream.ZMQStream(create_node_socket(context, identity), io_loop)
+
+        self.cmd_endpoint = cmd_endpoint
+        self._cmd_stream = zmqstream.ZMQStream(create_node_socket(context, identity), io_loop)
+
+        #datagram transport is only available on the threaded RNode
+        self.main_udp_endpoint = None
+
+        self.cmd_sig_manager = NodeSignalsManager(self.send_command)
+        self.msg_tcp_sig_manager = NodeSignalsManager(self.send_message_tcp)
+
+    def connect(self):
+        self._cmd_stream.connect(self.cmd_endpoint)
+        self._main_tcp_stream.connect(self.main_tcp_endpoint)
+
+    def start_polling(self, dispatch):
+        def _on_recv(assignment):
+            if not self._zero_copy:
+                return lambda msg: dispatch(assignment, msg)
+            return lambda frames: dispatch(assignment, unpack_frames(frames))
+
+        copy = not self._zero_copy
+        self._main_tcp_stream.on_recv(_on_recv(self.MESSAGE_ASSIGNMENT_MESSANGER), copy=copy)
+        self._cmd_stream.on_recv(_on_recv(self.MESSAGE_ASSIGNMENT_COMMAND), copy=copy)
+
+    #'func()' runs on the loop, a func returning a number is called again after that many seconds
+    def call_later(self, delay, func):
+        def _call():
+            next_delay = func()
+            if next_delay is not None:
+                self._io_loop.call_later(next_delay, _call)
+
+        self._io_loop.call_later(delay, _call)
+
+    def close(self):
+        self._main_tcp_stream.close()
+        self._cmd_stream.close()
+
+    #sends are queued on the stream and flushed by the event loop,
+    #so they never block and must be called from the loop thread
+    def send_command(self, command):
+        self._cmd_stream.send_multipart(command)
+        return SendStatus.Queued
+
+    def send_message_tcp(self, message, copy=True):
+        self._main_tcp_stream.send_multipart(message, copy=copy)
+        return SendStatus.Queued
+
+    def send_message_udp(self, message, copy=True):
+        raise Exception()
+
+class AsyncRNode(RNode):
+    #params (kwargs) are the same as RNode's, plus:
+    #   io_loop - loop driving the node, current loop by default
+    #   context - zmq.Context shared by nodes on the same loop
+    def __init__(self, name, **kwargs):
+        self._io_loop = kwargs.get('io_loop') or ioloop.IOLoop.current()
+        self._context = kwargs.get('context') or zmq.Context.instance()
+        self._init_futures = {}
+
+        super(AsyncRNode, self).__init__(name, **kwargs)
+
+    def _create_socket_worker(self, kwargs):
+        return StreamSocketWorker(self._node_id,
+                                  kwargs.get('main_tcp_endpoint', 'tcp://localhost:5557'),
+                                  kwargs.get('cmd_endpoint', 'tcp://localhost:5558'),
+                                  self._context, self._io_loop,
+                                  kwargs.get('zero_copy', False))
+
+    #returns a future resolved once the node and all its messengers are initialized
+    def start(self):
+        self._socket_worker.connect()
+        self._socket_worker.start_polling(self._dispatch)
+        self._msg_process_loop_started = True
+
+        futures = [self._initialize_messenger(None)]
+        for msgr in self._msgrs_dict.values():
+            futures.append(self._initialize_messenger(msgr))
+
+        return gen.multi(futures)
+
+    #acknowledgements are matched to the messenger they answer by its id
+    def _initialize_messenger(self, messenger):
+        future = Future()
+        if messenger is not None:
+            self._init_futures[messenger.messenger_id] = future
+
+        def _on_done(messenger, error):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(messenger)
+
+        self._send_initialization(messenger, _on_done)
+        return future
+
+    #worker processes forward requests through the poll thread of a NodeHost,
+    #which a node driven by an io loop does not have
+    def _register_messenger(self, messenger):
+        if messenger._processes:
+            raise Exception('Messenger %s: worker processes need the threaded RNode, '
+                            'AsyncRNode does not support them' % messenger.name)
+        self._add_messenger(messenger)
+
+        if self._msg_process_loop_started:
+            self._initialize_messenger(messenger)
+
+    def initialized(self, messenger):
+        return self._init_futures[messenger.messenger_id]
@@ -0,0 +1,58 @@
+from collections import deque
+from threading import Lock
+
+class BufferPool(object):
+    _MIN_BUFFER_SIZE = 4096
+
+    def __init__(self, max_free_buffers=4):
+        self._max_free_buffers = max_free_buffers
+        self._free = {}
+        self._in_flight = deque()
+        self._lock = Lock()
+
+    @classmethod
+    def _bucket_size(cls, size):
+        bucket_size = cls._MIN_BUFFER_SIZE
+        while bucket_size < size:
+            bucket_size <<= 1
+        return bucket_size
+
+    def acquire(self, size):
+        bucket_size = self._bucket_size(size)
+
+        with self._lock:
+            self._reclaim()
+            free = self._free.get(bucket_size)
+            if free:
+                return free.pop()
+
+        return bytearray(bucket_size)
+
+    def release(self, buffer):
+        bucket_size = len(buffer)
+        if bucket_size != self._bucket_size(bucket_size):
+            return
+
+        with self._lock:
+            self._release(buffer)
+
+    #buffer goes back to the pool once libzmq reports the message as sent
+    def release_when_done(self, buffer, tracker):
+        with self._lock:
+            if tracker is None or tracker.done:
+                self._release(buffer)
+            else:
+                self._in_flight.append((tracker, buffer))
+
+    def _release(self, buffer):
+        free = self._free.setdefault(len(buffer), [])
+        if len(free) < self._max_free_buffers:
+            free.append(buffer)
+
+    def _reclaim(self):
+        while self._in_flight and self._in_flight[0][0].done:
+            self._release(self._in_flight.popleft()[1])
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
@@ -0,0 +1,196 @@
+from __future__ import print_function
+from itertools import izip
+from struct import pack
+from timeit import Timer
+import argparse
+import json
+import platform
+import sys
+
+from enums import MessengerType, MessageValueType, NodeSignals
+from msg_codecs import (ROSMessageCodec, CommandCodec, ParamsCodec, NodeSignalsCodec,
+                        Parameter, _TO_BYTES, _FROM_BYTES)
+
+_SAMPLE_VALUES = {
+    MessageValueType.nothing: None,
+    MessageValueType.bool: True,
+    MessageValueType.int8: -12,
+    MessageValueType.uint8: 200,
+    MessageValueType.int16: -1200,
+    MessageValueType.uint16: 60000,
+    MessageValueType.int32: -120000,
+    MessageValueType.uint32: 4000000000,
+    MessageValueType.int64: -1200000000000,
+    MessageValueType.uint64: 12000000000000,
+    MessageValueType.float32: 21.5,
+    MessageValueType.float64: 103.25,
+    MessageValueType.string: 'status: ok',
+    MessageValueType.raw: b'\x00' * 16
+}
+
+_RAW_SIZES = [1024, 16 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+
+def make_message_type(name, value_types):
+    slots = ['f%i' % index for index in range(len(value_types))]
+
+    def __init__(self, *values):
+        for slot, value in izip(slots, values):
+            setattr(self, slot, value)
+
+    return type(name, (object,), {'__slots__': slots,
+                                  '_slot_types': [value_type.name for value_type in value_types],
+                                  '__init__': __init__})
+
+#per-field path the codec used before descriptions were compiled
+def legacy_encode_reply_msg(msg_desc, messenger_id, message):
+    encoded_message = [b'\x00', b'\x00', messenger_id]
+    for var_name, var_type in izip(msg_desc.arg_names, msg_desc.arg_types):
+        encoded_message.append(_TO_BYTES[var_type](getattr(message, var_name)))
+    return encoded_message
+
+def legacy_decode_request_msg(msg_desc, msg):
+    decoded_params = []
+    for (param_type, arg) in izip(msg_desc.arg_types, msg[3:]):
+        decoded_params.append(_FROM_BYTES[param_type](arg))
+    return msg_desc.type(*decoded_params)
+
+def _frames_size(result):
+    if isinstance(result, list):
+        return sum(len(frame) for frame in result if isinstance(frame, (bytes, bytearray, memoryview)))
+    return 0
+
+def measure(name, func, number):
+    number = max(1, number)
+    best = min(Timer(func).repeat(repeat=5, number=number))
+
+    return {'name': name,
+            'ops_per_s': number / best,
+            'us_per_op': best / number * 1e6,
+            'output_bytes': _frames_size(func())}
+
+def _ros_benchmarks(number):
+    messenger_id = b'\x01'
+    benchmarks = []
+
+    cases = [('%s' % value_type.name, [value_type]) for value_type in MessageValueType]
+    cases.append(('small', [MessageValueType.int32]))
+    cases.append(('wide', [value_type for value_type in MessageValueType] * 4))
+
+    for case_name, value_types in cases:
+        message_type = make_message_type('Bench_%s' % case_name, value_types)
+        codec = ROSMessageCodec(MessengerType.Service, message_type, message_type)
+        message = message_type(*[_SAMPLE_VALUES[value_type] for value_type in value_types])
+        frames = codec.encode_reply_msg(messenger_id, message)
+
+        benchmarks.append(('ros.encode.%s' % case_name, lambda c=codec, m=message: c.encode_reply_msg(messenger_id, m), number))
+        benchmarks.append(('ros.decode.%s' % case_name, lambda c=codec, f=frames: c.decode_request_msg(f), number))
+
+        if case_name == 'wide':
+            benchmarks.append(('ros.encode.wide.legacy',
+                               lambda c=codec, m=message: legacy_encode_reply_msg(c.reply, messenger_id, m), number))
+            benchmarks.append(('ros.decode.wide.legacy',
+                               lambda c=codec, f=frames: legacy_decode_request_msg(c.request, f), number))
+
+    raw_type = make_message_type('Bench_raw_payload', [MessageValueType.int32, MessageValueType.raw])
+    raw_codec = ROSMessageCodec(MessengerType.Service, raw_type, raw_type)
+    for size in _RAW_SIZES:
+        message = raw_type(1, b'\x00' * size)
+        frames = raw_codec.encode_reply_msg(messenger_id, message)
+        scaled = max(20, number * 1024 // size)
+        benchmarks.append(('ros.encode.raw_%ik' % (size // 1024), lambda m=message: raw_codec.encode_reply_msg(messenger_id, m), scaled))
+        benchmarks.append(('ros.decode.raw_%ik' % (size // 1024), lambda f=frames: raw_codec.decode_request_msg(f), scaled))
+
+    return benchmarks
+
+def _command_benchmarks(number):
+    params = [MessageValueType.int32, MessageValueType.float64]
+    call = [b'\x02', b'\x00', b'\x01', pack(b'i', 7), b'CALL', pack(b'i', 2), pack(b'd', 3.5)]
+    raw_call = [b'\x02', b'\x00', b'\x01', pack(b'i', 8), b'CALL', b'\x00' * 64 * 1024]
+
+    def _decode(message, arg_types):
+        decoded = CommandCodec.decode_command_call(message)
+        return CommandCodec.decode_command_call_args(arg_types, decoded['args'])
+
+    return [
+        ('command.decode_call', lambda: _decode(call, params), number),
+        ('command.decode_call.raw_64k', lambda: _decode(raw_call, [MessageValueType.raw]), number),
+        ('command.encode_reply', lambda: CommandCodec.encode_command_reply(7, b'CALL', params, [2, 3.5]), number),
+        ('command.encode_reply.raw_64k',
+         lambda: CommandCodec.encode_command_reply(8, b'CALL', [MessageValueType.raw], [b'\x00' * 64 * 1024]), number)
+    ]
+
+def _params_benchmarks(number):
+    value_types = [value_type for value_type in MessageValueType
+                   if value_type not in (MessageValueType.nothing, MessageValueType.raw)]
+    params = {}
+    for index in range(200):
+        value_type = value_types[index % len(value_types)]
+        params[index] = Parameter('param_%i' % index, index, 'benchmark parameter', value_type,
+                                  _SAMPLE_VALUES[value_type], 0)
+
+    changes = []
+    for index in range(0, 200, 10):
+        changes.extend([pack(b'i', index), _TO_BYTES[params[index].type.value](params[index].value)])
+
+    scaled = max(1, number // 200)
+    return [
+        ('params.encode_info.200', lambda: ParamsCodec.encode_params_info(params.values()), scaled),
+        ('params.decode_changes.20', lambda: ParamsCodec.decode_params(params, changes), number // 10)
+    ]
+
+def _signals_benchmarks(number):
+    ping = [b'\x01', NodeSignals.IN_Ping.value]
+    return [
+        ('signals.encode', lambda: NodeSignalsCodec.encode_node_signal(NodeSignals.OUT_Pong, None), number),
+        ('signals.decode', lambda: NodeSignalsCodec.decode_node_signal(ping), number)
+    ]
+
+def run(number=20000, pattern=None):
+    benchmarks = _ros_benchmarks(number) + _command_benchmarks(number) + \
+                 _params_benchmarks(number) + _signals_benchmarks(number)
+
+    results = []
+    for name, func, iterations in benchmarks:
+        if pattern and pattern not in name:
+            continue
+        results.append(measure(name, func, iterations))
+
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'number': number,
+            'results': results}
+
+#returns results that got slower than the baseline by more than 'threshold'
+def compare(report, baseline, threshold=0.1):
+    baseline_results = dict((result['name'], result) for result in baseline['results'])
+    regressions = []
+    for result in report['results']:
+        previous = baseline_results.get(result['name'])
+        if previous and result['ops_per_s'] < previous['ops_per_s'] * (1.0 - threshold):
+            regressions.append((result['name'], previous['ops_per_s'], result['ops_per_s']))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Codec micro-benchmarks')
+    parser.add_argument('--number', type=int, default=20000)
+    parser.add_argument('--filter', default=None)
+    parser.add_argument('--output', default=None, help='write results as JSON')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    arguments = parser.parse_args()
+
+    report = run(arguments.number, arguments.filter)
+
+    for result in report['results']:
+        print('%-32s %12.0f ops/s %10.2f us/op' % (result['name'], result['ops_per_s'], result['us_per_op']))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as stream:
+            json.dump(report, stream, indent=2, sort_keys=True)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as stream:
+            regressions = compare(report, json.load(stream), arguments.threshold)
+        for name, before, after in regressions:
+            print('REGRESSION %s: %.0f -> %.0f ops/s' % (name, before, after))
+        sys.exit(1 if regressions else 0)
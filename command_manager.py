@@ -1,9 +1,11 @@
 from inspect import getargspec
 from threading import Lock
+from timeit import default_timer
 
 from enums import CommandUsage, MessageValueType
+from executors import check_picklable
 from msg_codecs import CommandCodec
-from utils import eprint, static_vars
+from utils import eprint, is_future, static_vars
 
 _COMMAND_ID_ATTR_NAME = 'cmd_id'
 _COMMAND_NAME_ATTR_NAME = 'cmd_name'
@@ -28,7 +30,8 @@ def command(name, params=None, description='', repl=None, repl_names=None, usage
         setattr(func, _REPLY_ATTR_NAME, repl)
         setattr(func, _COMMAND_USAGE_ATTR_NAME, usage)
 
-        setattr(func, _PARAM_NAMES_ATTR_NAME, _del_self(getargspec(func).args))
+        #coroutine wrappers keep the original function in __wrapped__
+        setattr(func, _PARAM_NAMES_ATTR_NAME, _del_self(getargspec(getattr(func, '__wrapped__', func)).args))
         setattr(func, _REPLY_NAMES_ATTR_NAME, ['repl%i' % i for i in ([] if not repl else range(len(repl)))] if not repl_names else \
                                                 repl_names if len(repl) <= len(repl_names) else \
                                                 repl + ['repl%i' % i  for i in range(len(repl_names), len(repl))])
@@ -41,7 +44,7 @@ def command(name, params=None, description='', repl=None, repl_names=None, usage
     return dec
 
 def _del_self(names):
-    if names[0] is 'self':
+    if names and names[0] == 'self':
         del names[0]
     return names
 
@@ -61,6 +64,31 @@ class Command(object):
 class CommandManager(object):
     def __init__(self):
         self.commands = {}
+        self.executor = None
+        self.metrics = None
+        self._command_executors = {}
+
+    def set_executor(self, executor):
+        for command in self.commands.values():
+            if command.id not in self._command_executors:
+                self._check_executor(command, executor)
+        self.executor = executor
+
+    #System commands always run inline on the message process thread
+    def set_command_executor(self, command_id, executor):
+        if executor is None:
+            self._command_executors.pop(command_id, None)
+            return
+
+        command = self.commands.get(command_id)
+        if command is not None:
+            self._check_executor(command, executor)
+        self._command_executors[command_id] = executor
+
+    @staticmethod
+    def _check_executor(command, executor):
+        if command.usage != CommandUsage.System:
+            check_picklable(command.callback, executor)
 
     def register_command(self, callback, msgr_id):
         try:
@@ -69,21 +97,54 @@ class CommandManager(object):
             eprint('Function %s is not a command. Registration aborted.' % callback.__name__)
             return
 
+        self._check_executor(command, self._command_executors.get(command.id, self.executor))
         self.commands[command.id] = command
 
-    def call_command(self, call_message):
+    #send_reply gets the encoded reply, commands may return a future
+    #and the reply is sent once it is resolved
+    def call_command(self, call_message, send_reply):
         decoded_message = CommandCodec.decode_command_call(call_message)
         command = self.commands[decoded_message['command_id']]
         args = CommandCodec.decode_command_call_args(command.params, decoded_message['args'])
 
+        executor = None if command.usage == CommandUsage.System else \
+                   self._command_executors.get(command.id, self.executor)
+        metrics = self.metrics if self.metrics and self.metrics.enabled else None
+        started = default_timer() if metrics else None
+
         try:
-            command_result = command.callback(*args)
+            if executor is not None:
+                command_result = executor.submit(command.callback, *args)
+            else:
+                command_result = command.callback(*args)
         except:
             eprint('Error while calling command: [%i] %s' % (command.id, command.name))
             return
-            
-        call_result = CommandCodec.encode_command_reply(command.id, 
-                                                        decoded_message['call_id'], 
-                                                        command.repl, 
-                                                        command_result)
-        return call_result
+
+        if is_future(command_result):
+            def _on_done(future):
+                if metrics:
+                    metrics.on_callback(command.name, default_timer() - started)
+
+                try:
+                    result = future.result()
+                except:
+                    eprint('Error while calling command: [%i] %s' % (command.id, command.name))
+                    return
+
+                send_reply(self._encode_result(command, decoded_message['call_id'], result))
+
+            command_result.add_done_callback(_on_done)
+            return
+
+        if metrics:
+            metrics.on_callback(command.name, default_timer() - started)
+
+        send_reply(self._encode_result(command, decoded_message['call_id'], command_result))
+
+    @staticmethod
+    def _encode_result(command, call_id, command_result):
+        return CommandCodec.encode_command_reply(command.id, 
+                                                 call_id, 
+                                                 command.repl, 
+                                                 command_result)
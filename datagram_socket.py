@@ -0,0 +1,80 @@
+import errno
+import socket
+from struct import error as struct_error
+
+import zmq
+
+from msg_codecs import DatagramCodec
+from utils import eprint
+
+def _frame_bytes(frame):
+    if type(frame) is bytes:
+        return frame
+    if isinstance(frame, zmq.Frame):
+        return frame.bytes
+
+    try:
+        return memoryview(frame).tobytes()
+    except TypeError:
+        #old-style buffers, array.array on python 2
+        return bytes(buffer(frame))
+
+#UDP socket with the send/recv_multipart interface of a zmq socket,
+#it can be registered in a zmq.Poller next to the DEALER sockets.
+#Delivery is best effort: datagrams that can't be sent right away are dropped
+class DatagramSocket(object):
+    MAX_DATAGRAM_SIZE = 65507
+
+    def __init__(self, identity):
+        self._identity = identity
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self.dropped = 0
+
+    @staticmethod
+    def parse_endpoint(endpoint):
+        address = endpoint[len('udp://'):] if endpoint.startswith('udp://') else endpoint
+        (host, port) = address.rsplit(':', 1)
+        return (host, int(port))
+
+    def connect(self, endpoint):
+        self._socket.connect(self.parse_endpoint(endpoint))
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def close(self):
+        self._socket.close()
+
+    def send_multipart(self, frames, flags=0, copy=True, track=False):
+        frames = [_frame_bytes(frame) for frame in frames]
+        datagram = DatagramCodec.encode_datagram(self._identity, frames)
+
+        if len(datagram) > self.MAX_DATAGRAM_SIZE:
+            eprint('Datagram of %i bytes is too large, dropped' % len(datagram))
+            self.dropped += 1
+            return
+
+        try:
+            self._socket.send(datagram)
+        except socket.error as error:
+            if error.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS, errno.ECONNREFUSED):
+                raise
+            self.dropped += 1
+
+    def recv_multipart(self, flags=0, copy=True):
+        while True:
+            try:
+                datagram = self._socket.recv(self.MAX_DATAGRAM_SIZE)
+            except socket.error as error:
+                if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    raise zmq.Again()
+                #ICMP port unreachable from an earlier send, nothing to receive
+                if error.errno == errno.ECONNREFUSED:
+                    continue
+                raise
+
+            try:
+                return DatagramCodec.decode_datagram(datagram)[1]
+            except (ValueError, struct_error):
+                self.dropped += 1
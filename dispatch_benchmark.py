@@ -0,0 +1,87 @@
+from __future__ import print_function
+from struct import pack
+from threading import Thread
+from timeit import default_timer
+
+import zmq
+
+from enums import DeviceType, MessageType, MessageSubtype, NodeSignals
+from rnode import RNode
+
+class EchoMessage(object):
+    def __init__(self, value=0):
+        self.value = value
+
+    __slots__ = ['value']
+    _slot_types = ['int32']
+
+_MAIN_ENDPOINT = 'tcp://127.0.0.1:25557'
+_CMD_ENDPOINT = 'tcp://127.0.0.1:25558'
+
+def _percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+#round trips service requests through one node, timing each request to reply
+def measure(inline_dispatch, count=20000):
+    context = zmq.Context()
+    main_socket = context.socket(zmq.ROUTER)
+    main_socket.bind(_MAIN_ENDPOINT)
+    cmd_socket = context.socket(zmq.ROUTER)
+    cmd_socket.bind(_CMD_ENDPOINT)
+
+    running = [True]
+    node = RNode('DispatchBenchmark',
+                 main_tcp_endpoint=_MAIN_ENDPOINT, cmd_endpoint=_CMD_ENDPOINT,
+                 loop_condition=lambda: running[0],
+                 inline_dispatch=inline_dispatch)
+    service = node.def_service_msgr('Echo', 'Echo', DeviceType.Nothing,
+                                    EchoMessage, EchoMessage, lambda request: request)
+
+    ack = [MessageType.NodeSignal.value, NodeSignals.IN_Null.value]
+    identity = []
+
+    #node initialization plus one per messenger, including the node's own one
+    init_count = 1 + len(node._msgrs_dict)
+
+    def _acknowledge_initialization():
+        for _ in range(init_count):
+            frames = main_socket.recv_multipart()
+            identity.append(frames[0])
+            main_socket.send_multipart([frames[0]] + ack)
+
+    server_thread = Thread(target=_acknowledge_initialization)
+    server_thread.start()
+    node.start()
+    server_thread.join()
+
+    request = [identity[0], MessageType.Common.value, MessageSubtype.Reply.value,
+               service.messenger_id, pack('i', 1)]
+    latencies = []
+    for _ in xrange(count):
+        started = default_timer()
+        main_socket.send_multipart(request)
+        main_socket.recv_multipart()
+        latencies.append(default_timer() - started)
+
+    running[0] = False
+    node._socket_worker.close()
+    main_socket.close()
+    cmd_socket.close()
+    context.term()
+
+    latencies.sort()
+    return {'p50_us': _percentile(latencies, 50) * 1e6,
+            'p99_us': _percentile(latencies, 99) * 1e6,
+            'msgs_per_s': count / sum(latencies)}
+
+def run(count=20000):
+    results = [('queued', measure(False, count)), ('inline', measure(True, count))]
+
+    for name, result in results:
+        print('%-8s p50 %8.1f us  p99 %8.1f us  %10.0f msgs/s' %
+              (name, result['p50_us'], result['p99_us'], result['msgs_per_s']))
+
+    return results
+
+if __name__ == '__main__':
+    run()
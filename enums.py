@@ -13,11 +13,15 @@ class MessageType(Enum):
 class NodeSignals(Enum):
     IN_Null = "\x00"
     IN_Ping = "\x01"
+    #messengers that gained or lost all their listeners
+    IN_Interest = "\x02"
 
     OUT_MessangerInitialization = "\x80"
     OUT_CommandInitialization = "\x81"
     OUT_Pong = "\x82"
     OUT_Null = "\x83"
+    #asks the server to report listener changes with IN_Interest
+    OUT_Interest = "\x84"
 
     @classmethod
     def get_IN_signals(cls):
@@ -27,11 +31,16 @@ class NodeSignals(Enum):
 class CommandMessageSubtype(Enum):
     Request = b'\x00'
     Reply = b'\x01'
+    #the call was not run, the reply holds the reason
+    Error = b'\x02'
 
 class MessageSubtype(Enum):
     Reply = b"\x00"
     Goal = b"\01"
     Feedback = b"\02"
+    Batch = b"\03"
+    #the request was not served, the reply holds the reason
+    Error = b"\04"
 
 class MessengerType(Enum):
     Nothing = b"\xFF"
@@ -71,3 +80,27 @@ class ParamFlags(Enum):
 class CommandUsage(Enum):
     Common = b"\x00"
     System = b"\x01"
+
+class BackpressurePolicy(Enum):
+    Block = 0
+    DropNewest = 1
+    DropOldest = 2
+    KeepLatest = 3
+
+#returned by send_reply, with or without a backpressure policy
+class SendStatus(Enum):
+    #handed to the socket worker (or the policy queue), it leaves from the poll thread
+    Queued = 0
+    Dropped = 1
+    #queued in place of older messages that were dropped
+    Replaced = 2
+    #not sent, nothing changed since the last message of the topic or nobody listens to it
+    Suppressed = 3
+
+class OverrunPolicy(Enum):
+    #missed periods are skipped, the task stays on its original schedule
+    Skip = 0
+    #missed periods are fired back to back until the task is on schedule again
+    CatchUp = 1
+    #the schedule restarts one period after the late run
+    Reschedule = 2
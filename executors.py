@@ -0,0 +1,91 @@
+from collections import deque
+from threading import Lock
+import pickle
+
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from utils import eprint
+
+def needs_pickling(executor):
+    return getattr(executor, 'processes', False) or isinstance(executor, ProcessPoolExecutor)
+
+#process pools pickle the callable, bound methods and closures can not be sent to them
+def check_picklable(callback, executor):
+    if executor is None or not needs_pickling(executor):
+        return
+
+    try:
+        pickle.dumps(callback, pickle.HIGHEST_PROTOCOL)
+    except Exception as error:
+        raise Exception('%s can not run on a process pool, it has to be a module level function (%s)'
+                        % (getattr(callback, '__name__', callback), error))
+
+#pools start their threads with the first submitted call
+def started_threads(executor):
+    executor = getattr(executor, '_executor', executor)
+    return bool(getattr(executor, '_threads', None)) or \
+           getattr(executor, '_queue_management_thread', None) is not None
+
+#runs callbacks off the message process thread with at most max_concurrency in flight,
+#calls beyond the limit wait in a queue instead of blocking the caller.
+#process pools need picklable (module level) callbacks and arguments
+class CallbackExecutor(object):
+    def __init__(self, workers=4, max_concurrency=None, processes=False, executor=None):
+        if executor is None:
+            executor = ProcessPoolExecutor(workers) if processes else ThreadPoolExecutor(workers)
+
+        self.processes = isinstance(executor, ProcessPoolExecutor)
+        self._executor = executor
+        self._max_concurrency = max_concurrency or workers
+        self._running = 0
+        self._waiting = deque()
+        self._lock = Lock()
+
+    def submit(self, func, *args):
+        pending_call = Future()
+        pending_call.set_running_or_notify_cancel()
+
+        with self._lock:
+            if self._running >= self._max_concurrency:
+                self._waiting.append((pending_call, func, args))
+                return pending_call
+            self._running += 1
+
+        self._start(pending_call, func, args)
+        return pending_call
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+
+    @property
+    def waiting(self):
+        return len(self._waiting)
+
+    def _start(self, pending_call, func, args):
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception as error:
+            eprint('Error while submitting call: %s' % error)
+            self._on_done(pending_call, None, error)
+            return
+
+        future.add_done_callback(lambda f: self._on_done(pending_call, f, None))
+
+    def _on_done(self, pending_call, future, error):
+        with self._lock:
+            if self._waiting:
+                next_call = self._waiting.popleft()
+            else:
+                next_call = None
+                self._running -= 1
+
+        if next_call is not None:
+            self._start(*next_call)
+
+        if future is not None:
+            error = future.exception()
+
+        if error is not None:
+            pending_call.set_exception(error)
+        else:
+            pending_call.set_result(future.result())
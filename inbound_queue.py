@@ -0,0 +1,119 @@
+from collections import deque
+from threading import Condition
+import time
+
+from metrics import LatencyHistogram
+
+#inbound messages waiting for the process thread, one FIFO per priority class.
+#classes are served by weighted round robin: while several classes have messages
+#waiting, each one gets up to its weight of turns per round, higher classes first,
+#so control traffic overtakes bulk data without starving it
+class InboundQueue(object):
+    SIGNAL = 0
+    SYSTEM_COMMAND = 1
+    USER_COMMAND = 2
+    DATA = 3
+
+    CLASS_NAMES = ('signal', 'system_command', 'user_command', 'data')
+    WEIGHTS = (8, 4, 2, 1)
+
+    #capacity - messages each class may hold (0 is unbounded), or a tuple with one per class.
+    #a message arriving at a full class is dropped, the poll thread never waits for room
+    #since that would hold back the classes above it as well.
+    #signals are never dropped, a lost initialization ack or interest change is not resent
+    def __init__(self, capacity=0, weights=WEIGHTS):
+        classes = len(self.CLASS_NAMES)
+        capacities = list(capacity) if isinstance(capacity, (tuple, list)) else [capacity] * classes
+        capacities[self.SIGNAL] = 0
+        self.capacities = tuple(capacities)
+        self._weights = tuple(weights)
+
+        self._queues = [deque() for _ in range(classes)]
+        self._credits = list(self._weights)
+        self._condition = Condition()
+        self._closed = False
+
+        self._size = 0
+        self.high_water = 0
+        self.dropped = [0] * classes
+        self.class_high_water = [0] * classes
+        #time from entering the queue to reaching its head and being taken,
+        #only measured with timing set since it costs two clock reads per message
+        self.timing = False
+        self.wait_time = [LatencyHistogram() for _ in range(classes)]
+
+    def qsize(self):
+        return self._size
+
+    def put(self, item, priority=DATA):
+        queue = self._queues[priority]
+        capacity = self.capacities[priority]
+
+        with self._condition:
+            if capacity and len(queue) >= capacity:
+                self.dropped[priority] += 1
+                return False
+
+            queue.append((time.time() if self.timing else None, item))
+            self._condition.notify()
+
+            self._size += 1
+            if self._size > self.high_water:
+                self.high_water = self._size
+            depth = len(queue)
+            if depth > self.class_high_water[priority]:
+                self.class_high_water[priority] = depth
+        return True
+
+    #blocks until a message is available, returns None once closed and empty
+    def get(self):
+        with self._condition:
+            while True:
+                priority = self._next_class()
+                if priority is not None:
+                    break
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+            (queued_at, item) = self._queues[priority].popleft()
+            self._size -= 1
+
+        if queued_at is not None:
+            self.wait_time[priority].add(time.time() - queued_at)
+        return item
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    #called with the condition held
+    def _next_class(self):
+        for _ in range(2):
+            waiting = False
+            for priority, queue in enumerate(self._queues):
+                if not queue:
+                    continue
+                waiting = True
+                if self._credits[priority]:
+                    self._credits[priority] -= 1
+                    return priority
+
+            if not waiting:
+                return None
+            #every class with messages used its turns, next round
+            self._credits = list(self._weights)
+
+    def snapshot(self):
+        return dict((name, {'depth': len(self._queues[priority]),
+                            'high_water': self.class_high_water[priority],
+                            'dropped': self.dropped[priority],
+                            'wait': self.wait_time[priority].snapshot()})
+                    for priority, name in enumerate(self.CLASS_NAMES))
+
+    def reset(self):
+        self.high_water = self._size
+        self.dropped = [0] * len(self.CLASS_NAMES)
+        self.class_high_water = [0] * len(self.CLASS_NAMES)
+        self.wait_time = [LatencyHistogram() for _ in self.CLASS_NAMES]
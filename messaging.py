@@ -1,12 +1,22 @@
 import struct
-from threading import Thread
+from itertools import izip
+from operator import attrgetter
+from threading import Thread, Lock
+from timeit import default_timer
 from Queue import Queue
 
-from utils import eprint
+import zmq
+
+from utils import eprint, is_future, monotonic
+from buffer_pool import BufferPool
+from metrics import MessengerMetrics
+from messenger_processes import MessengerProcesses
+from executors import check_picklable
+from outgoing_queue import OutgoingQueue
 from command_manager import command, CommandManager
 from param_manager import ParamManager
 from msg_codecs import RawMessageCodec, ROSMessageCodec, CommandCodec, ParamsCodec
-from enums import MessageValueType, MessengerType, CommandUsage, NodeSignals, TransportProtocol, DeviceType
+from enums import MessageValueType, MessengerType, CommandUsage, NodeSignals, TransportProtocol, DeviceType, SendStatus
 
 class _Messenger(object):
     def __init__(self, node_id, messenger_id,
@@ -24,24 +34,31 @@ class _Messenger(object):
         self.messenger_id = messenger_id
         self.transport_protocol = transport_protocol
 
+        self.metrics = MessengerMetrics()
+
         self._params_mngr = None
         self._commands_mngr = CommandManager()
+        self._commands_mngr.metrics = self.metrics
         self._socket_worker = socket_worker
-        self._send_func = self._socket_worker.send_message_tcp #\
-                          #if transport_protocol == TransportProtocol.TCP else \
-                          #self._socket_worker.send_message_udp
+        self._send_func = self._socket_worker.send_message_tcp \
+                          if transport_protocol == TransportProtocol.TCP else \
+                          self._socket_worker.send_message_udp
 
         self.param_in = param_in
         self.param_out = param_out
 
         self._is_initialized = False
+        self.init_error = None
+        self._processes = None
+        self._outgoing = None
 
         if param_in:
             self._params_mngr = ParamManager(param_in, param_out)
             self.add_command(self._change_params)
             self.add_command(self._get_parameters_info)
+            self.add_command(self._get_parameters_changes)
 
-    def _initialize(self):
+    def _send_initialization(self):
         msg = self._codec.encode_init_msg(self.messenger_id,
                                           self.transport_protocol,
                                           self.messenger_type,
@@ -49,9 +66,13 @@ class _Messenger(object):
                                           self.device_name,
                                           self.device_type)
   
-        func = lambda: self._socket_worker.msg_tcp_sig_manager.send_signal(NodeSignals.OUT_MessangerInitialization, msg)
-        self._socket_worker.msg_tcp_sig_manager.perform_and_block_until_signal(func, NodeSignals.IN_Null)
-    
+        self._socket_worker.msg_tcp_sig_manager.send_signal(NodeSignals.OUT_MessangerInitialization, msg)
+
+    @property
+    def is_initialized(self):
+        return self._is_initialized
+
+    def _send_commands_initialization(self):
         for cmd in self._commands_mngr.commands.values():
             msg = CommandCodec.encode_command_init(cmd)
             self._socket_worker.cmd_sig_manager.send_signal(NodeSignals.OUT_CommandInitialization, msg)
@@ -59,8 +80,55 @@ class _Messenger(object):
         self._is_initialized = True
 
     def process_command(self, call_message):
-        call_result = self._commands_mngr.call_command(call_message)
-        self._socket_worker.send_command(call_result)
+        if self.metrics.enabled:
+            self.metrics.on_received(call_message)
+
+        #System commands need the parent's state (parameters), the rest go to worker processes
+        if self._processes and not self._is_system_command(call_message):
+            self._processes.forward_command(call_message)
+            return
+
+        self._commands_mngr.call_command(call_message, self._socket_worker.send_command)
+
+    def _is_system_command(self, call_message):
+        command = self._commands_mngr.commands.get(CommandCodec.decode_command_call(call_message)['command_id'])
+        return command is None or command.usage == CommandUsage.System
+
+    #policies other than Block never block the caller, send_reply returns the SendStatus of the message.
+    #hwm is the number of messages this messenger may have queued in front of the socket.
+    #Block does not wait on the poll thread (inline dispatch, batch timers), messages sent
+    #from there are queued beyond hwm
+    def set_backpressure_policy(self, policy, hwm=500):
+        if getattr(self, 'zero_copy', False):
+            raise Exception('Backpressure policies need copying sends')
+        if not hasattr(self._socket_worker, 'try_send_message_tcp'):
+            raise Exception('Backpressure policies need the threaded RNode, '
+                            'AsyncRNode streams queue sends on the event loop')
+
+        try_send = self._socket_worker.try_send_message_tcp \
+                   if self.transport_protocol == TransportProtocol.TCP else \
+                   self._socket_worker.try_send_message_udp
+        self._outgoing = OutgoingQueue(policy, hwm, try_send,
+                                       self._socket_worker.call_later,
+                                       self._socket_worker.in_poll_thread,
+                                       self.metrics)
+
+    @property
+    def pending(self):
+        return self._outgoing.depth if self._outgoing else 0
+
+    #returns a SendStatus whether or not a policy is set
+    def _send(self, msg, copy=True):
+        if self._outgoing is not None:
+            return self._outgoing.put(msg)
+
+        try:
+            if copy:
+                return self._send_func(msg)
+            return self._send_func(msg, copy=False)
+        except:
+            self.metrics.failed_sends += 1
+            raise
 
     def add_command(self, command):
         self._commands_mngr.register_command(command, self.messenger_id)
@@ -69,6 +137,14 @@ class _Messenger(object):
             msg = CommandCodec.encode_command_init(command)
             self._socket_worker.cmd_sig_manager.send_signal(NodeSignals.OUT_CommandInitialization, msg)
 
+    #runs user commands (and service requests) on the executor
+    #instead of the message process thread
+    def set_executor(self, executor):
+        self._commands_mngr.set_executor(executor)
+
+    def set_command_executor(self, command, executor):
+        self._commands_mngr.set_command_executor(command.cmd_id, executor)
+
     def set_param_on_change_callback(self, key, callback):
         if not self._params_mngr:
             raise Exception()
@@ -96,6 +172,14 @@ class _Messenger(object):
     def _get_parameters_info(self):
         return self._params_mngr.get_parameters_info()
 
+    @command('GetParChg',
+             description='Get parameters changed since version',
+             params=[MessageValueType.uint32],
+             repl=[MessageValueType.raw],
+             usage=CommandUsage.System)
+    def _get_parameters_changes(self, since):
+        return self._params_mngr.get_parameters_changes(since)
+
     @command('ChPar', 
              description='Change parameters value', 
              params=[MessageValueType.raw], 
@@ -122,16 +206,51 @@ class RawMessenger(_Messenger):
     def __init__(self, node_id, messenger_id,
                  name, device_name, device_type,
                  socket_worker, transport_protocol,
-                 param_in, param_out):
+                 param_in, param_out,
+                 zero_copy=False, buffer_pool=None):
         super(RawMessenger, self).__init__(node_id, messenger_id,
                                            name, device_name, device_type, MessengerType.Raw,
                                            RawMessageCodec(),
                                            socket_worker, transport_protocol,
                                            param_in, param_out)
+        self.zero_copy = zero_copy
+        self._buffer_pool = buffer_pool if buffer_pool is not None else \
+                            BufferPool() if zero_copy else None
 
+    #in zero-copy mode buffers must not be modified until libzmq is done with them,
+    #send_buffer() gives pooled buffers back once it is
     def send_reply(self, raw_message):
+        (status, _) = self._send_raw(raw_message)
+        return status
+
+    #returns (SendStatus, zmq.MessageTracker of the frames or None when they were copied)
+    def _send_raw(self, raw_message):
         msg = self._codec.encode_raw_message(raw_message)
-        self._send_func(msg)
+        if self.metrics.enabled:
+            self.metrics.on_sent(msg)
+
+        if not self.zero_copy:
+            return (self._send(msg), None)
+
+        frames = [zmq.Frame(frame, copy=False, track=True) for frame in msg]
+        return (self._send(frames, copy=False), zmq.MessageTracker(*frames))
+
+    def acquire_buffer(self, size):
+        if not self._buffer_pool:
+            raise Exception()
+
+        return self._buffer_pool.acquire(size)
+
+    #sends first 'length' bytes of a pooled buffer without copying,
+    #the buffer is given back to the pool once libzmq is done with it
+    def send_buffer(self, buffer, length=None):
+        if not self.zero_copy:
+            raise Exception()
+
+        frame = buffer if length is None else memoryview(buffer)[:length]
+        (status, tracker) = self._send_raw(frame)
+        self._buffer_pool.release_when_done(buffer, tracker)
+        return status
 
 class _ROSMessageWrapper(_Messenger):
     def __init__(self, node_id, messenger_id,
@@ -146,39 +265,250 @@ class _ROSMessageWrapper(_Messenger):
                                                  param_in, param_out)
 
 class TopicNode(_ROSMessageWrapper):
+    #batch_size - messages packed into one Batch message, 0 sends every message on its own
+    #batch_bytes - field bytes that flush a batch before it is full
+    #batch_window - seconds a batch may wait for more messages
+    #messenger_type, request_type - set by ServiceNode
     def __init__(self, node_id, messenger_id,
                  name, device_name, device_type,
                  socket_worker, transport_protocol,
                  reply_type, 
-                 param_in, param_out):
+                 param_in, param_out,
+                 batch_size=0, batch_bytes=64 * 1024, batch_window=0.005,
+                 messenger_type=MessengerType.Topic, request_type=None):
         super(TopicNode, self).__init__(node_id, messenger_id,
-                                        name, device_name, device_type, MessengerType.Topic,
+                                        name, device_name, device_type, messenger_type,
                                         socket_worker, transport_protocol,
-                                        reply_type, None, None, param_in, param_out)
+                                        reply_type, request_type, None, param_in, param_out)
+
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.batch_window = batch_window
+        self._batch = []
+        self._batch_count = 0
+        self._batch_length = 0
+        self._batch_started = None
+        self._batch_timer_armed = False
+        self._batch_lock = Lock()
+
+        self._change_filter = None
+        self._last_values = None
+        self._last_sent = None
+        self._filter_lock = Lock()
+
+        #False while the server reports no listeners, see RNode on_demand
+        self.is_active = True
+        self._active_callback = None
+
+    _NUMERIC_TYPES = frozenset(value_type.value for value_type in
+                               (MessageValueType.int8, MessageValueType.uint8,
+                                MessageValueType.int16, MessageValueType.uint16,
+                                MessageValueType.int32, MessageValueType.uint32,
+                                MessageValueType.int64, MessageValueType.uint64,
+                                MessageValueType.float32, MessageValueType.float64))
+
+    #send_reply() then skips messages whose fields all stay within their deadband of the last
+    #message sent and returns SendStatus.Suppressed for them.
+    #deadbands - {field name: deadband} or one deadband for every numeric field,
+    #            0 and non-numeric fields have to be equal
+    #keep_alive - seconds after which an unchanged message is sent anyway, None never resends it
+    def set_change_filter(self, deadbands=0, keep_alive=1.0):
+        names = self._codec.reply.arg_names
+        types = self._codec.reply.arg_types
+
+        if isinstance(deadbands, dict):
+            unknown = set(deadbands) - set(name for name, arg_type in izip(names, types)
+                                           if arg_type in self._NUMERIC_TYPES)
+            if unknown:
+                raise Exception('No numeric fields named %s' % ', '.join(sorted(unknown)))
+            bands = tuple(deadbands.get(name, 0) for name in names)
+        else:
+            bands = tuple(deadbands if arg_type in self._NUMERIC_TYPES else 0 for arg_type in types)
+
+        get_values = attrgetter(*names) if len(names) > 1 else lambda message: tuple(getattr(message, name) for name in names)
+        with self._filter_lock:
+            self._change_filter = (get_values, bands if any(bands) else None, keep_alive)
+            self._last_values = None
+
+    def _is_unchanged(self, reply_message):
+        (get_values, bands, keep_alive) = self._change_filter
+        values = get_values(reply_message)
+        now = monotonic()
+
+        with self._filter_lock:
+            last = self._last_values
+            if last is not None and (keep_alive is None or now - self._last_sent < keep_alive):
+                if bands is None:
+                    unchanged = values == last
+                else:
+                    unchanged = all(value == last_value if not band else abs(value - last_value) <= band
+                                    for value, last_value, band in izip(values, last, bands))
+                if unchanged:
+                    self.metrics.suppressed += 1
+                    return True
+
+            #compared against the last sent values, so slow drift still gets through
+            self._last_values = values
+            self._last_sent = now
+        return False
+
+    #'callback(active)' is called on the message process thread
+    #when the topic gets its first listener or loses its last one
+    def set_active_callback(self, callback):
+        self._active_callback = callback
+
+    def _set_active(self, active):
+        if active == self.is_active:
+            return
+
+        #new listeners get the next message even if it matches the last one sent
+        if active:
+            with self._filter_lock:
+                self._last_values = None
+        self.is_active = active
+        if self._active_callback:
+            try:
+                self._active_callback(active)
+            except Exception as error:
+                eprint('Error in active callback of %s: %r' % (self.name, error))
 
     def send_reply(self, reply_message):
+        if not self.is_active:
+            self.metrics.suppressed += 1
+            return SendStatus.Suppressed
+
         if reply_message is not None:
             if not isinstance(reply_message, self._codec.reply.type):
                 raise Exception()
 
+            if self._change_filter and self._is_unchanged(reply_message):
+                return SendStatus.Suppressed
+
+        if self.batch_size:
+            return self._add_to_batch(reply_message)
+
+        if not self.metrics.enabled:
+            return self._send(self._codec.encode_reply_msg(self.messenger_id, reply_message))
+
+        started = default_timer()
         msg = self._codec.encode_reply_msg(self.messenger_id, reply_message)
-        self._send_func(msg)
+        self.metrics.on_sent(msg, default_timer() - started)
+        return self._send(msg)
+
+    def flush(self):
+        if not self._batch_count:
+            return
+
+        with self._batch_lock:
+            self._send_batch()
+
+    def _add_to_batch(self, reply_message):
+        fields = self._codec.reply.encode_fields(reply_message)
+        arm_timer = False
+
+        with self._batch_lock:
+            self._batch.extend(fields)
+            self._batch_count += 1
+            self._batch_length += sum(len(field) for field in fields if field is not None)
+
+            if self._batch_count >= self.batch_size or self._batch_length >= self.batch_bytes:
+                return self._send_batch()
+
+            if self._batch_started is None:
+                self._batch_started = monotonic()
+            if not self._batch_timer_armed:
+                self._batch_timer_armed = arm_timer = True
+
+        if arm_timer:
+            self._socket_worker.call_later(self.batch_window, self._on_batch_timer)
+        return SendStatus.Queued
+
+    #runs on the poll thread, stays armed while a batch is pending
+    def _on_batch_timer(self):
+        with self._batch_lock:
+            if self._batch_started is not None:
+                remaining = self._batch_started + self.batch_window - monotonic()
+                if remaining > 0:
+                    return remaining
+                self._send_batch()
+
+            self._batch_timer_armed = False
+
+    #called with _batch_lock held, so batches leave in order
+    def _send_batch(self):
+        if not self._batch_count:
+            return
+
+        msg = self._codec.encode_batch_msg(self.messenger_id, self._batch, self._batch_count)
+        if self.metrics.enabled:
+            self.metrics.on_sent(msg, count=self._batch_count)
+
+        self._batch = []
+        self._batch_count = 0
+        self._batch_length = 0
+        self._batch_started = None
+        return self._send(msg)
 
 class ServiceNode(TopicNode):
     def __init__(self, node_id, messenger_id,
                  name, device_name, device_type,
                  socket_worker, transport_protocol, request_callback,
                  reply_type, request_type, 
-                 param_in, param_out):
-        super(TopicNode, self).__init__(node_id, messenger_id,
-                                        name, device_name, device_type, MessengerType.Service,
-                                        socket_worker, transport_protocol,
-                                        reply_type, request_type, None, param_in, param_out)
+                 param_in, param_out,
+                 processes=0):
+        super(ServiceNode, self).__init__(node_id, messenger_id,
+                                          name, device_name, device_type,
+                                          socket_worker, transport_protocol,
+                                          reply_type, param_in, param_out,
+                                          messenger_type=MessengerType.Service,
+                                          request_type=request_type)
         self._request_cb = request_callback
+        if processes:
+            self._processes = MessengerProcesses(self, processes)
+
+    def set_executor(self, executor):
+        check_picklable(self._request_cb, executor)
+        super(ServiceNode, self).set_executor(executor)
 
     def receive_request(self, request):
+        if self._processes:
+            if self.metrics.enabled:
+                self.metrics.on_received(request)
+            self._processes.forward_request(request)
+            return
+
+        metrics = self.metrics if self.metrics.enabled else None
+
+        started = default_timer() if metrics else None
         decoded_request = self._codec.decode_request_msg(request)
-        reply = self._request_cb(decoded_request)
+        if metrics:
+            decoded = default_timer()
+            metrics.on_received(request, decoded - started)
+            started = decoded
+
+        executor = self._commands_mngr.executor
+        if executor is not None:
+            reply = executor.submit(self._request_cb, decoded_request)
+        else:
+            reply = self._request_cb(decoded_request)
+
+        if is_future(reply):
+            reply.add_done_callback(lambda future: self._send_future_reply(future, started))
+            return
+
+        if metrics:
+            metrics.on_callback('request', default_timer() - started)
+        self.send_reply(reply)
+
+    def _send_future_reply(self, future, started=None):
+        if started is not None:
+            self.metrics.on_callback('request', default_timer() - started)
+
+        try:
+            reply = future.result()
+        except:
+            eprint('Error while processing request: %s' % self.name)
+            return
 
         self.send_reply(reply)
 
@@ -0,0 +1,143 @@
+from threading import Lock
+import multiprocessing
+import os
+import tempfile
+
+import zmq
+
+from node_socket_worker import unpack_frames
+from utils import eprint
+
+_ROUTE_COMMAND = b'\x00'
+_ROUTE_MESSAGE = b'\x01'
+
+#runs in a forked worker, the messenger is the parent's copy and must not touch
+#the parent's sockets, so replies go back to the parent which sends them to the server
+def _worker_main(messenger, requests_endpoint, replies_endpoint):
+    context = zmq.Context()
+    requests = context.socket(zmq.PULL)
+    requests.connect(requests_endpoint)
+    replies = context.socket(zmq.PUSH)
+    replies.connect(replies_endpoint)
+
+    #pool threads of the parent do not exist after fork
+    messenger._commands_mngr.executor = None
+    messenger._commands_mngr._command_executors = {}
+    messenger._commands_mngr.metrics = None
+
+    send_command = lambda frames: replies.send_multipart([_ROUTE_COMMAND] + frames)
+
+    while True:
+        frames = requests.recv_multipart()
+        (route, msg) = (frames[0], frames[1:])
+
+        try:
+            if route == _ROUTE_COMMAND:
+                messenger._commands_mngr.call_command(msg, send_command)
+                continue
+
+            reply = messenger._request_cb(messenger._codec.decode_request_msg(msg))
+            replies.send_multipart([_ROUTE_MESSAGE] + messenger._codec.encode_reply_msg(messenger.messenger_id, reply))
+        except Exception as error:
+            eprint('Error while processing request in worker %i: %r' % (os.getpid(), error))
+
+#hosts the request callback and user commands of a messenger in forked worker processes,
+#the parent keeps the server-facing sockets and forwards frames over ipc.
+#requests are spread round-robin, so replies of different workers may come back out of order.
+#RNode.start() forks the workers before its threads run, see RNode._check_fork
+class MessengerProcesses(object):
+    def __init__(self, messenger, workers):
+        if os.name != 'posix':
+            raise Exception('Messenger processes need fork and ipc transport')
+
+        self._messenger = messenger
+        self.workers = workers
+
+        self._host = None
+        self._endpoint = None
+        self._requests = None
+        self._replies = None
+        self._requests_lock = Lock()
+        self._processes = []
+
+    @property
+    def started(self):
+        return self._requests is not None
+
+    def start(self, host):
+        if self.started:
+            return
+
+        endpoint = 'ipc://%s/fringe-%i-%x' % (tempfile.gettempdir(), os.getpid(), id(self))
+        self._endpoint = endpoint
+        self._host = host
+
+        requests = host.context.socket(zmq.PUSH)
+        requests.setsockopt(zmq.LINGER, 0)
+        requests.bind(endpoint + '-requests')
+
+        replies = host.context.socket(zmq.PULL)
+        replies.setsockopt(zmq.LINGER, 0)
+        replies.bind(endpoint + '-replies')
+
+        for _ in range(self.workers):
+            process = multiprocessing.Process(target=_worker_main,
+                                              args=(self._messenger, endpoint + '-requests', endpoint + '-replies'))
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+
+        (self._requests, self._replies) = (requests, replies)
+        host.call_in_loop(lambda: host.register(replies, self._flush_replies))
+
+    def close(self):
+        if not self.started:
+            return
+
+        for process in self._processes:
+            process.terminate()
+            process.join()
+        self._processes = []
+
+        def _close():
+            self._host.unregister(self._replies)
+            self._replies.close()
+        self._host.call_in_loop(_close)
+
+        with self._requests_lock:
+            self._requests.close()
+            self._requests = None
+
+        for suffix in ('-requests', '-replies'):
+            try:
+                os.remove(self._endpoint[len('ipc://'):] + suffix)
+            except OSError:
+                pass
+
+    def forward_request(self, request):
+        self._forward(_ROUTE_MESSAGE, request)
+
+    def forward_command(self, call_message):
+        self._forward(_ROUTE_COMMAND, call_message)
+
+    def _forward(self, route, frames):
+        with self._requests_lock:
+            if self._requests is None:
+                raise Exception()
+            self._requests.send_multipart([route] + list(frames), copy=False)
+
+    #runs on the poll thread
+    def _flush_replies(self):
+        for _ in xrange(256):
+            try:
+                frames = unpack_frames(self._replies.recv_multipart(zmq.NOBLOCK, copy=False))
+            except zmq.Again:
+                return
+
+            if frames[0] == _ROUTE_COMMAND:
+                self._messenger._socket_worker.send_command(frames[1:])
+                continue
+
+            if self._messenger.metrics.enabled:
+                self._messenger.metrics.on_sent(frames[1:])
+            self._messenger._send(frames[1:], copy=False)
@@ -0,0 +1,87 @@
+#counters are plain attributes updated without locks, values may be slightly off
+#when several threads publish on the same messenger
+class LatencyHistogram(object):
+    #bucket i holds durations below 2^i microseconds
+    BUCKETS = 32
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        bucket = int(seconds * 1e6).bit_length()
+        self.counts[bucket if bucket < self.BUCKETS else self.BUCKETS - 1] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    #upper bound of the bucket holding the percentile, in microseconds
+    def percentile(self, percent):
+        if not self.count:
+            return None
+
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return 1 << bucket
+        return 1 << (self.BUCKETS - 1)
+
+    def snapshot(self):
+        return {'count': self.count,
+                'mean_us': self.total / self.count * 1e6 if self.count else None,
+                'max_us': self.max * 1e6,
+                'p50_us': self.percentile(50),
+                'p99_us': self.percentile(99)}
+
+class MessengerMetrics(object):
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.sent = 0
+        self.sent_bytes = 0
+        self.received = 0
+        self.received_bytes = 0
+        self.failed_sends = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self.encode_time = LatencyHistogram()
+        self.decode_time = LatencyHistogram()
+        self.callback_time = {}
+
+    def on_sent(self, frames, encode_time=None, count=1):
+        self.sent += count
+        self.sent_bytes += sum(len(frame) for frame in frames if frame is not None)
+        if encode_time is not None:
+            self.encode_time.add(encode_time)
+
+    def on_received(self, frames, decode_time=None):
+        self.received += 1
+        self.received_bytes += sum(len(frame) for frame in frames)
+        if decode_time is not None:
+            self.decode_time.add(decode_time)
+
+    def on_callback(self, callback_id, duration):
+        histogram = self.callback_time.get(callback_id)
+        if histogram is None:
+            histogram = self.callback_time[callback_id] = LatencyHistogram()
+        histogram.add(duration)
+
+    def snapshot(self):
+        return {'sent': self.sent,
+                'sent_bytes': self.sent_bytes,
+                'received': self.received,
+                'received_bytes': self.received_bytes,
+                'failed_sends': self.failed_sends,
+                'dropped': self.dropped,
+                'suppressed': self.suppressed,
+                'encode_time': self.encode_time.snapshot(),
+                'decode_time': self.decode_time.snapshot(),
+                'callback_time': dict((str(callback_id), histogram.snapshot())
+                                      for callback_id, histogram in self.callback_time.items())}
@@ -1,5 +1,6 @@
 import struct
 from itertools import izip
+from threading import Lock
 
 from enums import (CommandMessageSubtype, MessageSubtype, MessageType,
                    MessageValueType, MessengerType, ParamFlags, NodeSignals)
@@ -7,11 +8,33 @@ from utils import grouped
 
 
 class MessageDescription(object):
+    _cache = {}
+    _cache_lock = Lock()
+
     def __init__(self, message):
         self.type = message
         self.arg_types = [MessageValueType[slot].value for slot in message._slot_types]
         self.arg_names = message.__slots__
 
+        self.encode_fields = _compile_encoder(self.arg_names, self.arg_types)
+        self.encode_reply = _compile_encoder(self.arg_names, self.arg_types,
+                                             (MessageType.Common.value, MessageSubtype.Reply.value))
+        self.decode = _compile_decoder(message, self.arg_types)
+
+    #descriptions are shared by every messenger using the same message class
+    @classmethod
+    def of(cls, message):
+        description = cls._cache.get(message)
+        if description is not None:
+            return description
+
+        with cls._cache_lock:
+            description = cls._cache.get(message)
+            if description is None:
+                description = cls(message)
+                cls._cache[message] = description
+        return description
+
 class Parameter(object):
     def __init__(self, name, param_id, 
                  description=None, param_type=MessageValueType.nothing, value=None, flags=ParamFlags.normal.value):
@@ -21,6 +44,9 @@ class Parameter(object):
         self.flags = flags
         self.value = value
         self.type = param_type
+        #number of changes and the manager version of the last one
+        self.changes = 0
+        self.version = 0
 
 _TO_BYTES = {
     MessageValueType.nothing.value: lambda x: None,
@@ -39,6 +65,10 @@ _TO_BYTES = {
     MessageValueType.raw.value: lambda x: x
 }
 
+#zero-copy receive hands large frames over as memoryviews
+def _as_bytes(frame):
+    return frame if type(frame) is bytes else frame.tobytes()
+
 _FROM_BYTES = {
     MessageValueType.nothing.value: lambda x: None,
     MessageValueType.bool.value: lambda x: struct.unpack(b'?', x)[0],
@@ -52,10 +82,70 @@ _FROM_BYTES = {
     MessageValueType.uint64.value: lambda x: struct.unpack(b'L', x)[0],
     MessageValueType.float32.value: lambda x: struct.unpack(b'f', x)[0],
     MessageValueType.float64.value: lambda x: struct.unpack(b'd', x)[0],
-    MessageValueType.string.value: lambda x: x,
+    MessageValueType.string.value: _as_bytes,
     MessageValueType.raw.value: lambda x: x
 }
 
+_STRUCTS = {
+    MessageValueType.bool.value: struct.Struct(b'?'),
+    MessageValueType.int8.value: struct.Struct(b'b'),
+    MessageValueType.uint8.value: struct.Struct(b'B'),
+    MessageValueType.int16.value: struct.Struct(b'h'),
+    MessageValueType.uint16.value: struct.Struct(b'H'),
+    MessageValueType.int32.value: struct.Struct(b'i'),
+    MessageValueType.uint32.value: struct.Struct(b'I'),
+    MessageValueType.int64.value: struct.Struct(b'l'),
+    MessageValueType.uint64.value: struct.Struct(b'L'),
+    MessageValueType.float32.value: struct.Struct(b'f'),
+    MessageValueType.float64.value: struct.Struct(b'd')
+}
+
+#builds 'encode([messenger_id,] message)' returning the frame list in one expression,
+#so there is no per-field loop, getattr or format string parsing left on the hot path
+def _compile_encoder(arg_names, arg_types, header=None):
+    namespace = {}
+    frames = []
+
+    if header is not None:
+        for index, frame in enumerate(header):
+            namespace['_h%i' % index] = frame
+            frames.append('_h%i' % index)
+        frames.append('messenger_id')
+
+    for index, (name, value_type) in enumerate(izip(arg_names, arg_types)):
+        if value_type in _STRUCTS:
+            namespace['_p%i' % index] = _STRUCTS[value_type].pack
+            frames.append('_p%i(message.%s)' % (index, name))
+        elif value_type == MessageValueType.nothing.value:
+            frames.append('None')
+        else:
+            frames.append('message.%s' % name)
+
+    args = 'messenger_id, message' if header is not None else 'message'
+    source = 'def encode(%s):\n    return [%s]\n' % (args, ', '.join(frames))
+    exec source in namespace
+    return namespace['encode']
+
+#builds 'decode(frames)' constructing the message directly from the data frames
+def _compile_decoder(message, arg_types):
+    namespace = {'_type': message, '_as_bytes': _as_bytes}
+    args = []
+
+    for index, value_type in enumerate(arg_types):
+        if value_type in _STRUCTS:
+            namespace['_u%i' % index] = _STRUCTS[value_type].unpack
+            args.append('_u%i(frames[%i])[0]' % (index, index))
+        elif value_type == MessageValueType.nothing.value:
+            args.append('None')
+        elif value_type == MessageValueType.string.value:
+            args.append('_as_bytes(frames[%i])' % index)
+        else:
+            args.append('frames[%i]' % index)
+
+    source = 'def decode(frames):\n    return _type(%s)\n' % ', '.join(args)
+    exec source in namespace
+    return namespace['decode']
+
 class _BaseMessageCodec(object):
     def encode_init_msg(self, msgr_id, transport_protocol, 
                         msgr_type, name, dev_name, dev_type):
@@ -77,16 +167,18 @@ class RawMessageCodec(_BaseMessageCodec):
         return encoded_message
 
 class ROSMessageCodec(_BaseMessageCodec):
+    _REQUEST_DATA_INDEX = 3
+
     def __init__(self, msgr_type, reply_type, request_type=None, feedback_type=None):
-        self.reply = MessageDescription(reply_type)
+        self.reply = MessageDescription.of(reply_type)
         self.request = None
         self.feedback = None
 
         if msgr_type == MessengerType.Service:
-            self.request = MessageDescription(request_type)
+            self.request = MessageDescription.of(request_type)
 
         if msgr_type == MessengerType.Action:
-            self.feedback = MessageDescription(feedback_type)
+            self.feedback = MessageDescription.of(feedback_type)
 
         super(ROSMessageCodec, self).__init__()
 
@@ -107,28 +199,36 @@ class ROSMessageCodec(_BaseMessageCodec):
         return encoded_message
 
     def encode_reply_msg(self, messenger_id, msg):
-        encoded_message = [MessageType.Common.value,
-                           MessageSubtype.Reply.value,
-                           messenger_id]
-        encoded_message.extend(self._encode_msg_data(self.reply, msg))
-        return encoded_message
+        return self.reply.encode_reply(messenger_id, msg)
+
+    #[Common, Batch, messenger id, message count (H)] followed by the fields of every message
+    def encode_batch_msg(self, messenger_id, fields, count):
+        return [MessageType.Common.value, MessageSubtype.Batch.value, messenger_id, struct.pack('H', count)] + fields
+
+    #answers a request in place of its reply
+    @staticmethod
+    def encode_error_msg(messenger_id, error):
+        return [MessageType.Common.value, MessageSubtype.Error.value, messenger_id, error]
+
+    @staticmethod
+    def decode_batch_msg(frames):
+        count = struct.unpack('H', frames[0])[0]
+        fields = frames[1:]
+        size = len(fields) // count if count else 0
+        return [fields[index * size:(index + 1) * size] for index in range(count)]
 
     def encode_feedback_msg(self, msg):
         assert self.feedback is not None, 'No Feedback'
 
         encoded_message = [MessageType.Common.value,
                            MessageSubtype.Feedback.value]
-        encoded_message.extend(self._encode_msg_data(self.feedback, msg))
+        encoded_message.extend(self.feedback.encode_fields(msg))
         return encoded_message
 
     def decode_request_msg(self, msg):
         assert self.request is not None, 'No Request'
 
-        decoded_params = []
-        #why 1?
-        for (param_type, arg) in izip(self.request.arg_types, msg[3:]):
-            decoded_params.append(_FROM_BYTES[param_type](arg))
-        return self.request.type(*decoded_params)
+        return self.request.decode(msg[self._REQUEST_DATA_INDEX:])
 
     @staticmethod
     def _encode_msg_desc(msg_desc):
@@ -138,13 +238,6 @@ class ROSMessageCodec(_BaseMessageCodec):
             encoded_msg_desc.append(var_type)
         return encoded_msg_desc
 
-    @staticmethod
-    def _encode_msg_data(msg_desc, message):
-        decoded_args = []
-        for var_name, var_type in izip(msg_desc.arg_names, msg_desc.arg_types):
-            decoded_args.append(_TO_BYTES[var_type](getattr(message, var_name)))
-        return decoded_args
-
 class CommandCodec(object):
     @staticmethod
     def encode_command_init(command):
@@ -190,6 +283,14 @@ class CommandCodec(object):
 
         return [_FROM_BYTES[arg_type.value](arg) for arg_type, arg in izip(arg_types, args)]
 
+    @staticmethod
+    def encode_command_error(command_id, call_id, error):
+        return [MessageType.Command.value,
+                struct.pack('i', command_id),
+                CommandMessageSubtype.Error.value,
+                call_id,
+                error]
+
     @staticmethod
     def encode_command_reply(command_id, call_id, reply_desc, reply):
         encoded_message = [MessageType.Command.value,
@@ -233,7 +334,11 @@ class ParamsCodec(object):
             command_id = struct.unpack('i', index)[0]
             parameter = params[command_id]
 
-            decoded_result.append((parameter, _FROM_BYTES[parameter.type.value](value)))
+            #parameters outlive the message, zero-copy buffers are copied out
+            if parameter.type == MessageValueType.raw:
+                decoded_result.append((parameter, _as_bytes(value)))
+            else:
+                decoded_result.append((parameter, _FROM_BYTES[parameter.type.value](value)))
 
         return decoded_result
 
@@ -249,15 +354,48 @@ class ParamsCodec(object):
                            struct.pack('B', param.flags), 
                            param_type])
 
-            value = _TO_BYTES[param_type](param.value)
-        
-            if type(value) is list:
-                result.extend(value)
-            else:
-                result.append(value)
+            result.extend(ParamsCodec._encode_param_value(param))
+
+        return result
+
+    #list values (arrays) take one frame per item
+    @staticmethod
+    def _encode_param_value(param):
+        value = _TO_BYTES[param.type.value](param.value)
+        return value if type(value) is list else [value]
+
+    #[epoch, version] followed by (id, changes, value frame count, value frames) of every given parameter
+    @staticmethod
+    def encode_params_changes(epoch, version, params):
+        result = [struct.pack('I', epoch), struct.pack('I', version)]
+
+        for param in params:
+            value = ParamsCodec._encode_param_value(param)
+            result.extend([struct.pack('i', param.id),
+                           struct.pack('I', param.changes),
+                           struct.pack('H', len(value))])
+            result.extend(value)
 
         return result
 
+    #values of list parameters come back as lists of frames
+    @staticmethod
+    def decode_params_changes(frames):
+        epoch = struct.unpack('I', frames[0])[0]
+        version = struct.unpack('I', frames[1])[0]
+
+        changes = []
+        index = 2
+        while index < len(frames):
+            (param_id, param_changes, count) = frames[index:index + 3]
+            count = struct.unpack('H', count)[0]
+            value = frames[index + 3:index + 3 + count]
+            changes.append((struct.unpack('i', param_id)[0], struct.unpack('I', param_changes)[0],
+                            value[0] if count == 1 else value))
+            index += 3 + count
+
+        return epoch, version, changes
+
     @staticmethod
     def encode_params_yaml(params):
         return {param.name: param.value for param in params.itervalues()}
@@ -286,7 +424,69 @@ class NodeSignalsCodec(object):
 
         return (signal, data)
 
+    #IN_Interest data, a state frame (1 - listened to, 0 - no listeners) followed by raw messenger ids
+    @staticmethod
+    def encode_interest(active, messenger_ids):
+        return [b'\x01' if active else b'\x00'] + list(messenger_ids)
+
+    @staticmethod
+    def decode_interest(data):
+        return (data[0] == b'\x01', data[1:])
+
 class NodeMessageCodec(object):
     @staticmethod
-    def encode_node_initialization(name):
-        return [MessageType.NodeInitialization.value, name]
+    def encode_node_initialization(name, messenger_id_width=1):
+        if messenger_id_width == 1:
+            return [MessageType.NodeInitialization.value, name]
+        return [MessageType.NodeInitialization.value, name, struct.pack('B', messenger_id_width)]
+
+    #servers that do not know wider ids ack without data
+    @staticmethod
+    def decode_node_initialization_ack(data):
+        return struct.unpack('B', data[0])[0] if data else 1
+
+    #messenger initialization ack data, the answered signal followed by the messenger id
+    @staticmethod
+    def encode_messenger_initialization_ack(messenger_id):
+        return [NodeSignals.OUT_MessangerInitialization.value, messenger_id]
+
+    #None for acks without a messenger id, servers sending them acknowledge in order
+    @staticmethod
+    def decode_messenger_initialization_ack(data):
+        if data and len(data) == 2 and data[0] == NodeSignals.OUT_MessangerInitialization.value:
+            return data[1]
+        return None
+
+#multipart message packed into one datagram:
+#identity length (B), identity, frame count (H), then length (I) and data of each frame
+class DatagramCodec(object):
+    _HEADER = struct.Struct(b'!B')
+    _COUNT = struct.Struct(b'!H')
+    _LENGTH = struct.Struct(b'!I')
+
+    @classmethod
+    def encode_datagram(cls, identity, frames):
+        parts = [cls._HEADER.pack(len(identity)), identity, cls._COUNT.pack(len(frames))]
+        for frame in frames:
+            parts.append(cls._LENGTH.pack(len(frame)))
+            parts.append(frame)
+        return b''.join(parts)
+
+    @classmethod
+    def decode_datagram(cls, datagram):
+        identity_end = 1 + cls._HEADER.unpack_from(datagram, 0)[0]
+        identity = datagram[1:identity_end]
+        (count,) = cls._COUNT.unpack_from(datagram, identity_end)
+
+        frames = []
+        offset = identity_end + cls._COUNT.size
+        for _ in xrange(count):
+            (length,) = cls._LENGTH.unpack_from(datagram, offset)
+            offset += cls._LENGTH.size
+            frames.append(datagram[offset:offset + length])
+            offset += length
+
+        if offset != len(datagram):
+            raise ValueError('Malformed datagram')
+
+        return (identity, frames)
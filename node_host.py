@@ -0,0 +1,254 @@
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+from threading import Thread, Lock, Event
+from thread import get_ident
+import os
+
+import zmq
+
+from utils import eprint, monotonic
+from inbound_queue import InboundQueue
+
+#one zmq context, one poll thread and one message process thread shared by
+#the socket workers of any number of nodes. A node without an explicit host
+#gets a private one, which is what every node used to have
+class NodeHost(object):
+    POLL_TIMEOUT = 64
+
+    #max_queue_size - capacity of each inbound priority class, see InboundQueue
+    def __init__(self, context=None, max_queue_size=0, loop_condition=lambda: True):
+        self._owns_context = context is None
+        self.context = context or zmq.Context()
+        self._loop_condition = loop_condition
+
+        self._poller = zmq.Poller()
+        self._handlers = {}
+        self._workers = []
+
+        #callbacks run by the poll thread, the only one allowed to touch polled sockets
+        self._calls = deque()
+        self._calls_lock = Lock()
+
+        #(deadline, id, func), a func returning a number is called again after that many seconds
+        self._timers = []
+        self._timer_ids = count()
+        self._timers_lock = Lock()
+
+        #lets other threads cut a poll short, zmq can only poll pipes on posix
+        self._wakeup_fds = os.pipe() if os.name == 'posix' else None
+        if self._wakeup_fds:
+            self.register(self._wakeup_fds[0], self._drain_wakeups)
+
+        self.msg_queue = InboundQueue(max_queue_size)
+
+        self.poll_thread_id = None
+        self._poll_thread = None
+        self._process_thread = None
+        self._running = False
+        self._stopped = False
+
+    @property
+    def nodes_count(self):
+        return len(self._workers)
+
+    @property
+    def started(self):
+        return self._poll_thread is not None or self._process_thread is not None
+
+    def start(self):
+        if self._poll_thread:
+            return
+
+        self._running = True
+        self._poll_thread = Thread(target=self._poll_loop, name='node-host-poll')
+        self._poll_thread.start()
+
+    def start_processing(self):
+        if self._process_thread:
+            return
+
+        self._process_thread = Thread(target=self._process_loop, name='node-host-process')
+        self._process_thread.start()
+
+    def close(self):
+        self._running = False
+        self._wakeup()
+        if self._poll_thread and get_ident() != self.poll_thread_id:
+            self._poll_thread.join()
+        if self._process_thread and self._process_thread.ident != get_ident():
+            self._process_thread.join()
+
+        for worker in list(self._workers):
+            worker.close()
+
+        if self._wakeup_fds:
+            for fd in self._wakeup_fds:
+                os.close(fd)
+            self._wakeup_fds = None
+
+        if self._owns_context and not self.context.closed:
+            self.context.term()
+
+    #runs 'func()' on the poll thread after 'delay' seconds
+    def call_later(self, delay, func):
+        with self._timers_lock:
+            entry = (monotonic() + delay, next(self._timer_ids), func)
+            heappush(self._timers, entry)
+            earliest = self._timers[0] is entry
+
+        if earliest and get_ident() != self.poll_thread_id:
+            self._wakeup()
+
+    def _wakeup(self):
+        if self._wakeup_fds:
+            os.write(self._wakeup_fds[1], b'\x00')
+
+    def _drain_wakeups(self):
+        os.read(self._wakeup_fds[0], 4096)
+
+    #returns the poll timeout in milliseconds
+    def _run_timers(self):
+        now = monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            with self._timers_lock:
+                (deadline, _, func) = heappop(self._timers)
+
+            try:
+                delay = func()
+            except Exception as error:
+                eprint('Error in timer callback: %r' % error)
+                delay = None
+
+            if delay is not None:
+                with self._timers_lock:
+                    heappush(self._timers, (deadline + delay, next(self._timer_ids), func))
+
+        if not self._timers:
+            return self.POLL_TIMEOUT
+        return max(0, min(self.POLL_TIMEOUT, int((self._timers[0][0] - monotonic()) * 1000)))
+
+    #runs 'func' on the poll thread and waits for it,
+    #directly when the loop is not running or when called from the poll thread
+    def call_in_loop(self, func):
+        done = Event()
+
+        def _call():
+            try:
+                func()
+            finally:
+                done.set()
+
+        with self._calls_lock:
+            run_now = self._stopped or not self._poll_thread or get_ident() == self.poll_thread_id
+            if not run_now:
+                self._calls.append(_call)
+
+        if run_now:
+            _call()
+        else:
+            self._wakeup()
+            done.wait()
+
+    #runs 'func()' on the poll thread without waiting for it
+    def post(self, func):
+        with self._calls_lock:
+            run_now = self._stopped
+            if not run_now:
+                self._calls.append(func)
+
+        if run_now:
+            func()
+        elif get_ident() != self.poll_thread_id:
+            self._wakeup()
+
+    #'handler()' is called by the poll thread when the socket (or file descriptor) is readable
+    def register(self, socket, handler):
+        self._poller.register(socket, zmq.POLLIN)
+        self._handlers[self._handler_key(socket)] = handler
+
+    def unregister(self, socket):
+        self._poller.unregister(socket)
+        self._handlers.pop(self._handler_key(socket), None)
+
+    #zmq.Poller reports plain sockets by their file descriptor
+    @staticmethod
+    def _handler_key(socket):
+        if isinstance(socket, (zmq.Socket, int)):
+            return socket
+        return socket.fileno()
+
+    def attach(self, worker):
+        self.call_in_loop(lambda: self._workers.append(worker))
+
+    def detach(self, worker):
+        def _detach():
+            if worker in self._workers:
+                self._workers.remove(worker)
+            worker._close_sockets()
+        self.call_in_loop(_detach)
+
+    #returns False when the message was dropped
+    def enqueue(self, dispatch, assignment, msg, priority=InboundQueue.DATA):
+        return self.msg_queue.put((dispatch, assignment, msg), priority)
+
+    @property
+    def queue_high_water(self):
+        return self.msg_queue.high_water
+
+    def _run_calls(self):
+        while self._calls:
+            with self._calls_lock:
+                call = self._calls.popleft()
+            call()
+
+    #workers whose node loop condition turned false stop being polled
+    def _check_workers(self):
+        for worker in list(self._workers):
+            if not worker.loop_condition():
+                self._workers.remove(worker)
+                worker._close_sockets()
+
+    def _poll_loop(self):
+        self.poll_thread_id = get_ident()
+        checked_at = monotonic()
+
+        while self._running and self._loop_condition():
+            timeout = self._run_timers()
+
+            for (socket, event) in self._poller.poll(timeout=timeout):
+                handler = self._handlers.get(socket)
+                if handler is None:
+                    continue
+
+                try:
+                    handler()
+                except Exception as error:
+                    eprint('Error while handling message: %r' % error)
+
+            if self._calls:
+                self._run_calls()
+
+            now = monotonic()
+            if now - checked_at >= self.POLL_TIMEOUT / 1000.0:
+                checked_at = now
+                self._check_workers()
+
+        with self._calls_lock:
+            self._stopped = True
+        self._run_calls()
+
+        #the message process loop stops once the queue is empty
+        self.msg_queue.close()
+
+    def _process_loop(self):
+        while True:
+            item = self.msg_queue.get()
+            if item is None:
+                break
+
+            (dispatch, assignment, msg) = item
+            try:
+                dispatch(assignment, msg)
+            except Exception as error:
+                eprint('Error while processing message: %r' % error)
@@ -1,55 +1,98 @@
-from threading import Thread
-from Queue import Queue
+from collections import deque
+from threading import Lock
+from thread import get_ident
 
 import zmq
 
+from enums import SendStatus
+from node_host import NodeHost
 from node_signals_manager import NodeSignalsManager
+from datagram_socket import DatagramSocket
+
+_zmq_HWM = 500
+_zmq_LINGER = 0
+
+#frames shorter than this are copied out even in zero-copy mode,
+#header frames have to be bytes to be used as enum values and dict keys
+ZERO_COPY_MIN_FRAME_SIZE = 256
+
+def create_node_socket(context, identity):
+    socket = context.socket(zmq.DEALER)
+    socket.setsockopt(zmq.IDENTITY, identity)
+    socket.setsockopt(zmq.RCVHWM, _zmq_HWM)
+    socket.setsockopt(zmq.SNDHWM, _zmq_HWM)
+    socket.setsockopt(zmq.LINGER, _zmq_LINGER)
+    return socket
+
+#frames sent with copy set are copied before they are queued, the caller may reuse its buffers
+def _owned_frame(frame):
+    if type(frame) is bytes or isinstance(frame, zmq.Frame):
+        return frame
+    return memoryview(frame).tobytes()
+
+def unpack_frames(frames):
+    return [frame.bytes if len(frame) < ZERO_COPY_MIN_FRAME_SIZE else frame.buffer
+            for frame in frames]
 
 class NodeSocketWorker(object):
     MESSAGE_ASSIGNMENT_COMMAND = 0x00
     MESSAGE_ASSIGNMENT_MESSANGER = 0x01
+    MESSAGE_ASSIGNMENT_DATAGRAM = 0x02
+
+    #messages received from one socket per poll wake-up,
+    #keeps a busy socket from starving the other one
+    MAX_RECV_BATCH = 256
+
+    _ROUTE_COMMAND = b'\x00'
+    _ROUTE_MESSAGE_TCP = b'\x01'
+    _ROUTE_MESSAGE_UDP = b'\x02'
+
+    #messages each socket may have waiting for the poll thread, more are dropped
+    MAX_OUTBOX_SIZE = 4096
+    #seconds before a full socket is tried again
+    OUTBOX_RETRY_DELAY = 0.01
 
     def __init__(self, identity, 
-                 main_tcp_endpoint, #main_udp_endpoint, 
+                 main_tcp_endpoint,
                  cmd_endpoint,
-                 loop_condition):
-        _zmq_HWM = 500
-        _zmq_LINGER = 0
-        
-        self._loop_condition = loop_condition
-        self._poll_loop_started = False 
-
-        self._context = zmq.Context()
+                 loop_condition,
+                 zero_copy=False,
+                 max_queue_size=0,
+                 main_udp_endpoint=None,
+                 host=None):
+        self.loop_condition = loop_condition
+        self._polling = False
+        self._closed = False
+        self._zero_copy = zero_copy
+
+        self._owns_host = host is None
+        self._host = host or NodeHost(max_queue_size=max_queue_size, loop_condition=loop_condition)
+        self._context = self._host.context
         self._identity = identity
 
         self.main_tcp_endpoint = main_tcp_endpoint
-        self._main_tcp_socket = self._context.socket(zmq.DEALER)
-        self._main_tcp_socket.setsockopt(zmq.IDENTITY, self._identity)
-        self._main_tcp_socket.setsockopt(zmq.RCVHWM, _zmq_HWM)
-        self._main_tcp_socket.setsockopt(zmq.SNDHWM, _zmq_HWM)
-        self._main_tcp_socket.setsockopt(zmq.LINGER, _zmq_LINGER)
-
-        #self.main_udp_endpoint = main_udp_endpoint
-        #self._main_udp_socket = self._context.socket(zmq.DEALER)
-        #self._main_udp_socket.setsockopt(zmq.IDENTITY, self._identity)
-        #self._main_udp_socket.setsockopt(zmq.RCVHWM, _zmq_HWM)
-        #self._main_udp_socket.setsockopt(zmq.SNDHWM, _zmq_HWM)
-        #self._main_udp_socket.setsockopt(zmq.LINGER, _zmq_LINGER)
+        self._main_tcp_socket = create_node_socket(self._context, self._identity)
 
-        self.cmd_endpoint = cmd_endpoint
-        self._cmd_socket = self._context.socket(zmq.DEALER) 
-        self._cmd_socket.setsockopt(zmq.IDENTITY, self._identity)
-        self._cmd_socket.setsockopt(zmq.RCVHWM, _zmq_HWM)
-        self._cmd_socket.setsockopt(zmq.SNDHWM, _zmq_HWM)
-        self._cmd_socket.setsockopt(zmq.LINGER, _zmq_LINGER)
-        
-        self.msg_queue = Queue()
+        self.main_udp_endpoint = main_udp_endpoint
+        self._main_udp_socket = DatagramSocket(self._identity) if main_udp_endpoint else None
 
-        self._poller = zmq.Poller()
+        self.cmd_endpoint = cmd_endpoint
+        self._cmd_socket = create_node_socket(self._context, self._identity)
 
-        self._thread = None
+        #only the poll thread touches the sockets, other threads queue their messages
+        #and wake it up. It never blocks on a full socket (a server that is gone),
+        #the messages wait in their queue and are tried again
+        self._outbox_routes = {self._ROUTE_COMMAND: self._cmd_socket,
+                               self._ROUTE_MESSAGE_TCP: self._main_tcp_socket,
+                               self._ROUTE_MESSAGE_UDP: self._main_udp_socket}
+        self._outboxes = dict((route, deque()) for route in self._outbox_routes)
+        self._outbox_lock = Lock()
+        self._flush_scheduled = False
+        self._sockets_closed = False
+        self.outbox_dropped = 0
+        self._deliver = None
 
-        #self.msg_udp_sig_manager = NodeSignalsManager(self.send_message_udp)
+        self.msg_udp_sig_manager = NodeSignalsManager(self.send_message_udp)
         self.cmd_sig_manager = NodeSignalsManager(self.send_command)
         self.msg_tcp_sig_manager = NodeSignalsManager(self.send_message_tcp)
 
@@ -59,50 +102,197 @@ class NodeSocketWorker(object):
     def connect(self):
         self._cmd_socket.connect(self.cmd_endpoint)
         self._main_tcp_socket.connect(self.main_tcp_endpoint)
-        #self._main_udp_socket.connect(self.main_udp_endpoint)
+        if self._main_udp_socket:
+            self._main_udp_socket.connect(self.main_udp_endpoint)
 
-    def start_polling(self):
-        self._poller.register(self._cmd_socket, zmq.POLLIN)
-        self._poller.register(self._main_tcp_socket, zmq.POLLIN)
-        #self._poller.register(self._main_udp_socket, zmq.POLLIN)
+    @property
+    def host(self):
+        return self._host
+
+    #'func()' runs on the poll thread, see NodeHost.call_later
+    def call_later(self, delay, func):
+        self._host.call_later(delay, func)
+
+    @property
+    def msg_queue(self):
+        return self._host.msg_queue
+
+    @property
+    def queue_high_water(self):
+        return self._host.queue_high_water
+
+    #with inline set, messages are decoded and routed right on the poll thread
+    #instead of going through the host msg_queue.
+    #'classify(assignment, msg)' gives the InboundQueue priority class of a message,
+    #'reject(assignment, msg)' is called on the poll thread for messages the queue dropped
+    def start_polling(self, dispatch, inline=False, classify=None, reject=None):
+        if self._polling:
+            return
+        self._polling = True
+
+        if inline:
+            self._deliver = dispatch
+        else:
+            if classify:
+                def _deliver(assignment, msg):
+                    if not self._host.enqueue(dispatch, assignment, msg, classify(assignment, msg)) and reject:
+                        reject(assignment, msg)
+                self._deliver = _deliver
+            else:
+                self._deliver = lambda assignment, msg: self._host.enqueue(dispatch, assignment, msg)
+            self._host.start_processing()
+
+        def _register():
+            self._host.register(self._cmd_socket,
+                                lambda: self._recv_batch(self._cmd_socket, self.MESSAGE_ASSIGNMENT_COMMAND))
+            self._host.register(self._main_tcp_socket,
+                                lambda: self._recv_batch(self._main_tcp_socket, self.MESSAGE_ASSIGNMENT_MESSANGER))
+            if self._main_udp_socket:
+                self._host.register(self._main_udp_socket,
+                                    lambda: self._recv_batch(self._main_udp_socket, self.MESSAGE_ASSIGNMENT_DATAGRAM))
+            self._host.attach(self)
+
+        self._host.call_in_loop(_register)
+        self._host.start()
 
-        self._start_poll_loop()
-    
     def close(self):
-        self._thread.join()
+        if self._closed:
+            return
+        self._closed = True
+
+        self._host.detach(self)
+        if self._owns_host:
+            self._host.close()
+
+    #called on the poll thread (or once it stopped)
+    def _close_sockets(self):
+        if self._sockets_closed:
+            return
+        self._sockets_closed = True
+
+        if self._polling:
+            #messages queued right before close still go out if the sockets take them
+            self._flush_outbox()
+            for socket in (self._cmd_socket, self._main_tcp_socket, self._main_udp_socket):
+                if socket is not None:
+                    self._host.unregister(socket)
+
         self._main_tcp_socket.close()
         self._cmd_socket.close()
-        self._context.term()
+        if self._main_udp_socket:
+            self._main_udp_socket.close()
 
     def send_command(self, command):
-        self._cmd_socket.send_multipart(command)
+        return self._send(self._ROUTE_COMMAND, command)
+
+    def send_message_tcp(self, message, copy=True):
+        return self._send(self._ROUTE_MESSAGE_TCP, message, copy)
+
+    #returns SendStatus.Queued, or SendStatus.Dropped when the outbox of the socket is full.
+    #without copy, frames are sent as they are, zmq.Frame objects keep their tracker
+    def _send(self, route, message, copy=True):
+        if copy:
+            frames = [_owned_frame(frame) for frame in message]
+        else:
+            frames = [frame if isinstance(frame, zmq.Frame) else zmq.Frame(frame, copy=False)
+                      for frame in message]
+
+        outbox = self._outboxes[route]
+        if len(outbox) >= self.MAX_OUTBOX_SIZE:
+            self.outbox_dropped += 1
+            return SendStatus.Dropped
+        outbox.append(frames)
 
-    def send_message_tcp(self, message):
-        self._main_tcp_socket.send_multipart(message)
+        if get_ident() == self._host.poll_thread_id:
+            self._flush_outbox()
+        else:
+            self._schedule_flush(None)
+        return SendStatus.Queued
 
-    #def send_message_udp(self, message):
-    #    self._main_udp_socket.send_multipart(message)
+    #one flush is pending at a time, a delay of None posts it right away
+    def _schedule_flush(self, delay):
+        with self._outbox_lock:
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
 
-    def _start_poll_loop(self):
-        if self._poll_loop_started:
+        if delay is None:
+            self._host.post(self._on_scheduled_flush)
+        else:
+            self._host.call_later(delay, self._on_scheduled_flush)
+
+    def _on_scheduled_flush(self):
+        with self._outbox_lock:
+            self._flush_scheduled = False
+        self._flush_outbox()
+
+    #runs on the poll thread, sends up to MAX_RECV_BATCH messages per socket without blocking.
+    #a full socket keeps its messages in order and is tried again later
+    def _flush_outbox(self):
+        if self._sockets_closed:
             return
 
-        self._poll_loop_started = True
-    
-        def _poll_loop():
-            while self._loop_condition():
-                sockets = self._poller.poll(timeout=64)
-
-                for (socket, event) in sockets:
-                    if(socket is self._main_tcp_socket): #or socket is self._main_udp_socket):
-                        msg = socket.recv_multipart()
-                        self.msg_queue.put((self.MESSAGE_ASSIGNMENT_MESSANGER, msg))
-                        continue
-
-                    if(socket is self._cmd_socket):
-                        msg = socket.recv_multipart()
-                        self.msg_queue.put((self.MESSAGE_ASSIGNMENT_COMMAND, msg))
-                        continue
-
-        self._thread = Thread(target=_poll_loop)
-        self._thread.start()
+        retry_delay = None
+        for route, outbox in self._outboxes.items():
+            socket = self._outbox_routes[route]
+            for _ in xrange(self.MAX_RECV_BATCH):
+                if not outbox:
+                    break
+                try:
+                    socket.send_multipart(outbox[0], zmq.NOBLOCK, copy=False)
+                except zmq.Again:
+                    retry_delay = self.OUTBOX_RETRY_DELAY
+                    break
+                outbox.popleft()
+            else:
+                if outbox and retry_delay is None:
+                    retry_delay = 0
+
+        if retry_delay is not None:
+            self._schedule_flush(retry_delay)
+
+    @property
+    def outbox_depth(self):
+        return sum(len(outbox) for outbox in self._outboxes.values())
+
+    def in_poll_thread(self):
+        return get_ident() == self._host.poll_thread_id
+
+    #poll thread only, return False instead of blocking when the socket is full
+    def try_send_message_tcp(self, message):
+        try:
+            self._main_tcp_socket.send_multipart(message, zmq.NOBLOCK)
+        except zmq.Again:
+            return False
+        return True
+
+    def try_send_message_udp(self, message):
+        self._main_udp_socket.send_multipart(message)
+        return True
+
+    @property
+    def datagrams_dropped(self):
+        return self._main_udp_socket.dropped if self._main_udp_socket else 0
+
+    def send_message_udp(self, message, copy=True):
+        if not self._main_udp_socket:
+            raise Exception()
+
+        return self._send(self._ROUTE_MESSAGE_UDP, message, copy)
+
+    def _recv_multipart(self, socket, flags=0):
+        if not self._zero_copy or socket is self._main_udp_socket:
+            return socket.recv_multipart(flags)
+
+        return unpack_frames(socket.recv_multipart(flags, copy=False))
+
+    def _recv_batch(self, socket, assignment):
+        deliver = self._deliver
+
+        for _ in xrange(self.MAX_RECV_BATCH):
+            try:
+                msg = self._recv_multipart(socket, zmq.NOBLOCK)
+            except zmq.Again:
+                return
+
+            deliver(assignment, msg)
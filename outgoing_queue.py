@@ -0,0 +1,81 @@
+from collections import deque
+from threading import Condition
+
+from enums import BackpressurePolicy, SendStatus
+
+#per-messenger queue in front of the node socket, drained by the poll thread
+#with non-blocking sends. 'hwm' bounds the queued messages, what happens to
+#a message beyond it depends on the policy
+class OutgoingQueue(object):
+    #seconds before a full socket is tried again
+    RETRY_DELAY = 0.001
+    #sends per drain, other sockets and timers of the poll thread get a turn in between
+    MAX_SEND_BATCH = 256
+
+    def __init__(self, policy, hwm, try_send, call_later, in_poll_thread, metrics):
+        self.policy = policy
+        self.hwm = 1 if policy == BackpressurePolicy.KeepLatest else max(1, hwm)
+
+        self._try_send = try_send
+        self._call_later = call_later
+        self._in_poll_thread = in_poll_thread
+        self._metrics = metrics
+
+        self._queue = deque()
+        self._condition = Condition()
+        self._draining = False
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    def put(self, msg):
+        status = SendStatus.Queued
+
+        with self._condition:
+            if len(self._queue) >= self.hwm:
+                #the poll thread drains the queue, so it can not wait for room
+                #and its messages go beyond hwm
+                if self.policy == BackpressurePolicy.Block and not self._in_poll_thread():
+                    while len(self._queue) >= self.hwm:
+                        self._condition.wait()
+                elif self.policy == BackpressurePolicy.DropNewest:
+                    self._metrics.dropped += 1
+                    return SendStatus.Dropped
+                elif self.policy != BackpressurePolicy.Block:
+                    while len(self._queue) >= self.hwm:
+                        self._queue.popleft()
+                        self._metrics.dropped += 1
+                    status = SendStatus.Replaced
+
+            self._queue.append(msg)
+
+            schedule = not self._draining
+            self._draining = True
+
+        if schedule:
+            self._call_later(0, self._drain)
+        return status
+
+    #runs on the poll thread, stays scheduled while the socket is full
+    def _drain(self):
+        for _ in xrange(self.MAX_SEND_BATCH):
+            with self._condition:
+                if not self._queue:
+                    self._draining = False
+                    return None
+                msg = self._queue.popleft()
+                self._condition.notify_all()
+
+            if not self._try_send(msg):
+                with self._condition:
+                    #a newer value arrived while this one waited, it is not needed anymore
+                    if self.policy == BackpressurePolicy.KeepLatest and self._queue:
+                        self._metrics.dropped += 1
+                    else:
+                        self._queue.appendleft(msg)
+                return self.RETRY_DELAY
+
+        #queued at the current time, so the poll loop runs before the next batch
+        self._call_later(0, self._drain)
+        return None
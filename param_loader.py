@@ -0,0 +1,60 @@
+import cPickle as pickle
+import os
+
+from yaml import load
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+from msg_codecs import ParamsCodec
+
+CACHE_SUFFIX = '.cache'
+_CACHE_VERSION = 2
+
+def _cache_key(path):
+    stat = os.stat(path)
+    return (_CACHE_VERSION, os.path.abspath(path), stat.st_mtime, stat.st_size)
+
+def _read_cache(path, key):
+    try:
+        with open(path + CACHE_SUFFIX, 'rb') as stream:
+            cached = pickle.load(stream)
+    except Exception:
+        return None
+
+    if not isinstance(cached, dict) or cached.get('key') != key:
+        return None
+    return cached
+
+#cache is an optimization only, unwritable directories are ignored
+def _write_cache(path, cached):
+    cache_path = path + CACHE_SUFFIX
+    tmp_path = '%s.%i.tmp' % (cache_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as stream:
+            pickle.dump(cached, stream, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError):
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+#returns the decoded parameters table and the encoded GetParInf reply,
+#a warm start (file unchanged since the cache was written) does no yaml parsing
+def load_params_info(path, use_cache=True):
+    key = _cache_key(path) if use_cache else None
+    if use_cache:
+        cached = _read_cache(path, key)
+        if cached is not None:
+            return cached['params'], cached['info']
+
+    with open(path, 'r') as stream:
+        params = ParamsCodec.decode_params_info_yaml(load(stream, Loader=_YamlLoader))
+    info = ParamsCodec.encode_params_info(params.values())
+
+    if use_cache:
+        _write_cache(path, {'key': key, 'params': params, 'info': info})
+
+    return params, info
@@ -1,22 +1,37 @@
-from yaml import load, dump
+from collections import OrderedDict
+from threading import Lock
 from utils import eprint
 from msg_codecs import ParamsCodec
+from param_loader import load_params_info
+from param_persister import get_persister, write_yaml_atomic
 
 import os
+import random
 
 class ParamManager(object):
-    def __init__(self, params_file, out_params_file=None):
+    #save_delay - seconds changes are coalesced before being saved, None uses the persister default
+    def __init__(self, params_file, out_params_file=None, persister=None, save_delay=None):
         self._params_path = params_file
         self._out_params_path = out_params_file
         self._callbacks = {}
         self._global_callback = None
+        self._lock = Lock()
+        self._persister = persister or get_persister()
+        self.save_delay = save_delay
         
         self.params = None
+        self._params_info = None
         self._set_file(params_file)
 
+        #version grows with every change_params, epoch tells clients
+        #that versions were restarted (the node was restarted)
+        self.version = 0
+        self.epoch = random.getrandbits(32)
+        self._changed = OrderedDict()
+        self._changes_reply = None
+
     def _set_file(self, file_path):
-        with open(file_path, 'r') as stream:
-            self.params = ParamsCodec.decode_params_info_yaml(load(stream))
+        self.params, self._params_info = load_params_info(file_path)
 
     def set_global_callback(self, callback):
         self._global_callback = callback
@@ -31,23 +46,69 @@ class ParamManager(object):
             self._callbacks[key] = callback
 
     def save_params(self):
-        with open(self._params_path, 'w') as stream:
-            dump(ParamsCodec.encode_params_info_yaml(self.params), stream, default_flow_style=False)
+        write_yaml_atomic(self._params_path, self._params_info_snapshot())
 
     def save_params_ros(self):
         if self._out_params_path:
-            with open(self._out_params_path, 'w') as stream:
-                dump(ParamsCodec.encode_params_yaml(self.params), stream, default_flow_style=False)       
+            write_yaml_atomic(self._out_params_path, self._params_snapshot())
+
+    def _params_info_snapshot(self):
+        with self._lock:
+            return ParamsCodec.encode_params_info_yaml(self.params)
+
+    def _params_snapshot(self):
+        with self._lock:
+            return ParamsCodec.encode_params_yaml(self.params)
 
     def get_parameters_info(self):
-        return ParamsCodec.encode_params_info(self.params.values())
+        params_info = self._params_info
+        if params_info is None:
+            with self._lock:
+                params_info = self._params_info = ParamsCodec.encode_params_info(self.params.values())
+        return params_info
+
+    #returns parameters changed after 'since', all of them for since == 0
+    def get_parameters_changes(self, since):
+        with self._lock:
+            cached = self._changes_reply
+            if cached is not None and cached[0] == since:
+                return cached[1]
+
+            if since == 0 or since > self.version:
+                params = self.params.values()
+            else:
+                params = []
+                for param in reversed(self._changed.values()):
+                    if param.version <= since:
+                        break
+                    params.append(param)
+
+            reply = ParamsCodec.encode_params_changes(self.epoch, self.version, params)
+            self._changes_reply = (since, reply)
+            return reply
 
     def change_params(self, changes):
         decoded_msg = ParamsCodec.decode_params(self.params, changes)
 
+        with self._lock:
+            self.version += 1
+            self._params_info = None
+            self._changes_reply = None
+
         for param, value in decoded_msg:
-            param.value = value
+            with self._lock:
+                param.value = value
+                param.changes += 1
+                param.version = self.version
+                self._changed.pop(param.id, None)
+                self._changed[param.id] = param
             if self._callbacks.has_key(param.name):
                 self._callbacks[param.name](value)
-        self.save_params()
-        self.save_params_ros()
+
+        #files are written later by the persister, several changes end up in one write
+        self._persister.schedule(self._params_path, self._params_info_snapshot, self.save_delay)
+        if self._out_params_path:
+            self._persister.schedule(self._out_params_path, self._params_snapshot, self.save_delay)
+
+    def flush(self):
+        self._persister.flush()
@@ -0,0 +1,138 @@
+from threading import Condition, Lock, Thread, current_thread
+import atexit
+import os
+import time
+
+from yaml import dump
+
+from utils import eprint
+
+def write_yaml_atomic(path, data):
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w') as stream:
+        dump(data, stream, default_flow_style=False)
+        stream.flush()
+        os.fsync(stream.fileno())
+
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        #rename does not replace existing files on windows
+        os.remove(path)
+        os.rename(tmp_path, path)
+
+#coalesces file writes over 'delay' seconds and performs them on a background thread,
+#only the latest snapshot of each file is written. delay <= 0 writes synchronously.
+#'delay' is the default for schedule() calls that do not pass their own.
+#close() (run at exit) writes what is pending and stops the writer thread, later saves are synchronous
+class ParamPersister(object):
+    def __init__(self, delay=0.5):
+        self.delay = delay
+
+        self._pending = {}
+        self._deadline = None
+        self._condition = Condition()
+        self._write_lock = Lock()
+        self._thread = None
+        self._closed = False
+
+        atexit.register(self.close)
+
+    #'snapshot' is called on the writer thread and returns data to dump,
+    #a pending write is done by the earliest deadline of the changes it holds
+    def schedule(self, path, snapshot, delay=None):
+        if delay is None:
+            delay = self.delay
+
+        with self._condition:
+            synchronous = delay <= 0 or self._closed
+            if synchronous:
+                self._pending.pop(path, None)
+            else:
+                self._schedule(path, snapshot, delay)
+
+        if synchronous:
+            self._write({path: snapshot})
+
+    #called with the condition held
+    def _schedule(self, path, snapshot, delay):
+        self._pending[path] = snapshot
+        deadline = time.time() + delay
+        if self._deadline is None or deadline < self._deadline:
+            self._deadline = deadline
+
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='param-persister')
+            #exit waits for non-daemon threads before atexit callbacks, close() joins it instead
+            self._thread.daemon = True
+            self._thread.start()
+
+        self._condition.notify()
+
+    def flush(self):
+        with self._condition:
+            pending = self._take_pending()
+            self._condition.notify()
+        self._write(pending)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+            thread = self._thread
+
+        if thread is not None and thread is not current_thread():
+            thread.join()
+        self.flush()
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    #the writer thread starts with the first delayed save
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def _take_pending(self):
+        pending, self._pending = self._pending, {}
+        self._deadline = None
+        return pending
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._deadline is None and not self._closed:
+                    self._condition.wait()
+                if self._deadline is None:
+                    return
+
+                remaining = self._deadline - time.time()
+                while remaining > 0 and not self._closed:
+                    self._condition.wait(remaining)
+                    if self._deadline is None:
+                        break
+                    remaining = self._deadline - time.time()
+
+                pending = self._take_pending()
+
+            self._write(pending)
+
+    def _write(self, pending):
+        with self._write_lock:
+            for path, snapshot in pending.items():
+                try:
+                    write_yaml_atomic(path, snapshot())
+                except (IOError, OSError) as error:
+                    eprint('Error while saving parameters to %s: %s' % (path, error))
+
+_default_persister = None
+_default_persister_lock = Lock()
+
+def get_persister():
+    global _default_persister
+
+    with _default_persister_lock:
+        if _default_persister is None:
+            _default_persister = ParamPersister()
+        return _default_persister
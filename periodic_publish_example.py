@@ -0,0 +1,30 @@
+from rnode import RNode
+from enums import DeviceType, OverrunPolicy
+
+from itertools import count
+from time import sleep
+
+class ExampleMessage(object):
+    def __init__(self, val):
+        self.A = val
+
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+#publishes a counter twice a second from the node's scheduler thread
+if __name__ == '__main__':
+    node = RNode('PeriodicNode')
+    topic = node.def_topic_msgr('PeriodicTopic', 'PeriodicTopicDevice',
+                                DeviceType.Nothing, ExampleMessage)
+
+    values = count()
+    task = node.add_periodic(topic, 2, lambda: ExampleMessage(next(values)),
+                             OverrunPolicy.Skip)
+    node.start()
+
+    try:
+        while True:
+            sleep(5)
+            print(task.snapshot())
+    finally:
+        node.close()
@@ -0,0 +1,169 @@
+from heapq import heappush, heappop
+from itertools import count
+from threading import Thread, Condition
+
+from enums import OverrunPolicy
+from metrics import LatencyHistogram
+from utils import eprint, monotonic
+
+class PeriodicTask(object):
+    def __init__(self, messenger, rate_hz, producer, overrun_policy):
+        if rate_hz <= 0:
+            raise Exception('Publish rate has to be positive: %r' % rate_hz)
+
+        self.messenger = messenger
+        self.period = 1.0 / rate_hz
+        self.producer = producer
+        self.overrun_policy = overrun_policy
+        self.cancelled = False
+        self.next_run = None
+        self.reset()
+
+    def reset(self):
+        self.fired = 0
+        self.skipped = 0
+        self.errors = 0
+        #runs skipped because nobody listened to the topic
+        self.idle = 0
+        #how late each run started compared to its scheduled time
+        self.lateness = LatencyHistogram()
+
+    def snapshot(self):
+        return {'messenger': self.messenger.name,
+                'rate_hz': 1.0 / self.period,
+                'fired': self.fired,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'idle': self.idle,
+                'lateness': self.lateness.snapshot()}
+
+    def _run(self):
+        #the producer is not even called for topics without listeners
+        if not getattr(self.messenger, 'is_active', True):
+            self.idle += 1
+            return
+
+        message = self.producer()
+        #a producer returning None has nothing to publish this period
+        if message is not None:
+            self.messenger.send_reply(message)
+
+    #called after a run, 'now' is when it finished
+    def _schedule_next(self, now):
+        self.next_run += self.period
+        if self.next_run > now:
+            return
+
+        if self.overrun_policy == OverrunPolicy.Skip:
+            missed = int((now - self.next_run) / self.period) + 1
+            self.skipped += missed
+            self.next_run += missed * self.period
+        elif self.overrun_policy == OverrunPolicy.Reschedule:
+            self.next_run = now + self.period
+
+#fires the periodic tasks of a node from one thread. Runs are placed on a fixed
+#grid of the monotonic clock (start + n * period), so a late run does not delay
+#the following ones
+class PublishScheduler(object):
+    def __init__(self, name='publish-scheduler'):
+        self._name = name
+        #(next run, id, task)
+        self._heap = []
+        self._ids = count()
+        self._tasks = []
+        self._condition = Condition()
+        self._thread = None
+        self._running = False
+
+    @property
+    def tasks(self):
+        return list(self._tasks)
+
+    #tasks added before start() are scheduled from the moment it is called,
+    #so a slow node start does not count as missed periods
+    def add(self, messenger, rate_hz, producer, overrun_policy=OverrunPolicy.Skip):
+        task = PeriodicTask(messenger, rate_hz, producer, overrun_policy)
+
+        with self._condition:
+            self._tasks.append(task)
+            if self._running:
+                self._arm(task, len(self._tasks) - 1, monotonic())
+                self._condition.notify()
+        return task
+
+    #called with the condition held. First runs of tasks started together are spread
+    #over their period instead of all of them firing at the same instant
+    def _arm(self, task, index, now):
+        phase = (index * 0.618033988749895) % 1.0
+        task.next_run = now + task.period * (1.0 + phase)
+        heappush(self._heap, (task.next_run, next(self._ids), task))
+
+    def remove(self, task):
+        with self._condition:
+            task.cancelled = True
+            if task in self._tasks:
+                self._tasks.remove(task)
+
+    def start(self):
+        with self._condition:
+            if self._thread:
+                return
+            self._running = True
+
+            self._heap = []
+            now = monotonic()
+            for index, task in enumerate(self._tasks):
+                self._arm(task, index, now)
+
+            self._thread = Thread(target=self._loop, name=self._name)
+            self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _next_due(self):
+        with self._condition:
+            while self._running:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                (due, _, task) = self._heap[0]
+                if task.cancelled:
+                    heappop(self._heap)
+                    continue
+
+                delay = due - monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                heappop(self._heap)
+                return task
+
+    def _loop(self):
+        while True:
+            task = self._next_due()
+            if task is None:
+                return
+
+            started = monotonic()
+            task.lateness.add(started - task.next_run)
+            try:
+                task._run()
+                task.fired += 1
+            except Exception as error:
+                task.errors += 1
+                eprint('Error in periodic publish of %s: %r' % (task.messenger.name, error))
+
+            task._schedule_next(monotonic())
+            with self._condition:
+                if not task.cancelled:
+                    heappush(self._heap, (task.next_run, next(self._ids), task))
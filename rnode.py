@@ -1,98 +1,261 @@
+from binascii import hexlify
+from collections import OrderedDict
 from struct import pack
-from threading import Thread
+from threading import Condition, Lock
+import json
+import time
 
 import messaging
-from msg_codecs import NodeSignalsCodec, NodeMessageCodec
-from enums import NodeSignals, MessageType, TransportProtocol
+from command_manager import command
+from msg_codecs import NodeSignalsCodec, NodeMessageCodec, CommandCodec, ROSMessageCodec
+from enums import (NodeSignals, MessageType, MessengerType, TransportProtocol, MessageValueType,
+                   CommandUsage, OverrunPolicy)
 from node_socket_worker import NodeSocketWorker
+from inbound_queue import InboundQueue
+from publish_scheduler import PublishScheduler
+from param_persister import get_persister
+from executors import started_threads
+from utils import eprint
+
+#counts initialization acks of a group of messengers sent together
+class _InitializationGroup(object):
+    def __init__(self, count):
+        self._remaining = count
+        self._condition = Condition()
+        self.errors = []
+
+    def done(self, messenger, error=None):
+        with self._condition:
+            if error is not None:
+                self.errors.append(error)
+            self._remaining -= 1
+            self._condition.notify_all()
+
+    def wait(self, deadline):
+        with self._condition:
+            while self._remaining > 0:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
 
 class RNode(object):
     _MESSAGE_TYPE_INDEX = 0
     _MESSENGER_ID_INDEX = 2
+    _MESSENGER_ID_FORMATS = {1: 'B', 2: 'H', 4: 'I'}
+    _QUEUE_FULL_ERROR = b'Inbound queue is full'
     #params (kwargs):
     #   param_in
     #   param_out
     #   loop_condition
-    #   main_endpoint
+    #   main_tcp_endpoint
+    #   main_udp_endpoint - UDP transport endpoint, UDP is off unless it is set
     #   cmd_endpoint
+    #   zero_copy
+    #   inline_dispatch
+    #   max_queue_size - inbound messages each priority class may queue (signals, system commands,
+    #                    user commands, service data), a tuple sets them one by one. Signals are
+    #                    never dropped, dropped commands and requests are answered with an error
+    #   host - NodeHost shared with other nodes, the node gets its own one by default
+    #   metrics - collect per-messenger counters and timings, off by default
+    #   messenger_id_width - bytes of messenger ids (1, 2 or 4), wider ids have to be
+    #                        accepted by the server during node initialization
+    #   init_timeout - seconds start() waits for the server to acknowledge initializations
+    #   param_save_delay - seconds parameter changes of this node's messengers are coalesced
+    #                      before being saved, 0 saves synchronously, the persister default otherwise
+    #   on_demand - ask the server which topics have listeners, topics nobody listens to
+    #               skip encoding and sending (TopicNode.is_active)
     def __init__(self, name, **kwargs):
         self._name = name
         self._param_in = kwargs.get('param_in')
         self._param_out = kwargs.get('param_out')
         
-        self._loop_condition = kwargs.get('loop_condition', lambda: True)
+        loop_condition = kwargs.get('loop_condition', lambda: True)
+        self._closed = False
+        self._loop_condition = lambda: not self._closed and loop_condition()
+        self._inline_dispatch = kwargs.get('inline_dispatch', False)
+        self._metrics_enabled = kwargs.get('metrics', False)
+        self._init_timeout = kwargs.get('init_timeout', 10.0)
+        self._on_demand = kwargs.get('on_demand', False)
+        #messenger id (None for the node itself) -> (messenger, on_done)
+        self._pending_inits = OrderedDict()
+        self._init_lock = Lock()
+
+        self._messenger_id_width = kwargs.get('messenger_id_width', 1)
+        if self._messenger_id_width not in self._MESSENGER_ID_FORMATS:
+            raise Exception('Unsupported messenger id width: %s' % self._messenger_id_width)
+        self._messenger_id_format = self._MESSENGER_ID_FORMATS[self._messenger_id_width]
+        self._messenger_id_limit = 1 << (8 * self._messenger_id_width)
+        self._param_save_delay = kwargs.get('param_save_delay')
         self._msg_process_loop_started = False
-        self._node_id = pack('i', hash(name))
-
-        self._socket_worker = NodeSocketWorker(self._node_id, 
-                                               kwargs.get('main_tcp_endpoint', 'tcp://localhost:5557'),
-                                               #kwargs.get('main_udp_endpoint', 'udp://localhost:5557'),
-                                               kwargs.get('cmd_endpoint', 'tcp://localhost:5558'),
-                                               self._loop_condition)
+        self._node_id = pack('I', hash(name) & 0xFFFFFFFF)
+
+        self._socket_worker = self._create_socket_worker(kwargs)
+        #the queue is shared by the nodes of a host, any of them can turn its timing on
+        msg_queue = getattr(self._socket_worker, 'msg_queue', None)
+        if msg_queue is not None and self._metrics_enabled:
+            msg_queue.timing = True
+
+        #raw message type -> {raw messenger id -> handler}, filled as messengers are registered
+        self._routes = {MessageType.Common.value: {},
+                        MessageType.Command.value: {}}
+        self._signal_routes = {self._socket_worker.MESSAGE_ASSIGNMENT_MESSANGER: self._socket_worker.msg_tcp_sig_manager.process_signal,
+                               self._socket_worker.MESSAGE_ASSIGNMENT_COMMAND: self._socket_worker.cmd_sig_manager.process_signal}
+        if self._socket_worker.main_udp_endpoint:
+            self._signal_routes[self._socket_worker.MESSAGE_ASSIGNMENT_DATAGRAM] = self._socket_worker.msg_udp_sig_manager.process_signal
 
         self._messenger_id_cnt = 0
-        self._node_messenger = messaging.MockMessengeer(self._node_id, pack('B', self._messenger_id_cnt),
+        self._msgrs_dict = {}
+        self._node_messenger = messaging.MockMessengeer(self._node_id, self._next_messenger_id(),
                                                         self._socket_worker, 
                                                         self._param_in, self._param_out)
-        self._messenger_id_cnt += 1
-
-        self._msgrs_dict = {self._node_messenger.messenger_id: self._node_messenger}
+        self._node_messenger.add_command(self._get_statistics)
+        self._scheduler = None
+        self._add_messenger(self._node_messenger)
         
+        self._socket_worker.msg_tcp_sig_manager.subscribe_on_signal(NodeSignals.IN_Null,
+                                                                    self._on_initialization_ack)
+        self._socket_worker.msg_tcp_sig_manager.subscribe_on_signal(NodeSignals.IN_Interest,
+                                                                    self._on_interest)
         self._socket_worker.msg_tcp_sig_manager.subscribe_on_signal(NodeSignals.IN_Ping, 
                                                                     lambda: self._socket_worker.msg_tcp_sig_manager.send_signal(NodeSignals.OUT_Pong))
-        #self._socket_worker.msg_udp_sig_manager.subscribe_on_signal(NodeSignals.IN_Ping, 
-        #                                                            lambda: self._socket_worker.msg_udp_sig_manager.send_signal(NodeSignals.OUT_Pong))
+        if self._socket_worker.main_udp_endpoint:
+            self._socket_worker.msg_udp_sig_manager.subscribe_on_signal(NodeSignals.IN_Ping, 
+                                                                        lambda: self._socket_worker.msg_udp_sig_manager.send_signal(NodeSignals.OUT_Pong))
         self._socket_worker.cmd_sig_manager.subscribe_on_signal(NodeSignals.IN_Ping, 
                                                                 lambda: self._socket_worker.cmd_sig_manager.send_signal(NodeSignals.OUT_Pong))
  
+    def _create_socket_worker(self, kwargs):
+        return NodeSocketWorker(self._node_id, 
+                                kwargs.get('main_tcp_endpoint', 'tcp://localhost:5557'),
+                                kwargs.get('cmd_endpoint', 'tcp://localhost:5558'),
+                                self._loop_condition,
+                                kwargs.get('zero_copy', False),
+                                kwargs.get('max_queue_size', 4096),
+                                kwargs.get('main_udp_endpoint'),
+                                kwargs.get('host'))
+
     def start(self):
+        #workers are forked before the node starts polling
+        processes = [msgr._processes for msgr in self._msgrs_dict.values() if msgr._processes]
+        if processes:
+            self._check_fork()
+        for msgr_processes in processes:
+            msgr_processes.start(self._socket_worker.host)
+
         self._socket_worker.connect() 
 
-        self._socket_worker.start_polling()
-        self._start_message_process_loop()
+        self._socket_worker.start_polling(self._dispatch, self._inline_dispatch, self._classify, self._reject)
+        self._msg_process_loop_started = True
 
-        func = lambda: self._socket_worker.send_message_tcp(NodeMessageCodec.encode_node_initialization(self._name))
-        self._socket_worker.msg_tcp_sig_manager.perform_and_block_until_signal(func, NodeSignals.IN_Null)
+        #node and messenger initializations are sent at once and acknowledged by messenger id,
+        #so startup costs one round trip whatever the number of messengers is
+        deadline = time.time() + self._init_timeout
+        node_group = _InitializationGroup(1)
+        self._send_initialization(None, node_group.done)
+        msgrs_group = self._send_messengers_initialization(self._msgrs_dict.values())
 
-        for msgr in self._msgrs_dict.values():
-            msgr._initialize()
+        if not node_group.wait(deadline):
+            self._cancel_initialization(None)
+            raise Exception('Node %s was not initialized' % self._name)
+        if node_group.errors:
+            raise node_group.errors[0]
 
-    def _start_message_process_loop(self):
-        if self._msg_process_loop_started:
-            return
+        #lets the server learn the address datagrams have to be sent to
+        if self._socket_worker.main_udp_endpoint:
+            self._socket_worker.msg_udp_sig_manager.send_signal(NodeSignals.OUT_Null)
 
-        self._msg_process_loop_started = True
+        errors = self._wait_messengers_initialization(self._msgrs_dict.values(), msgrs_group, deadline)
+
+        #topics stay active until the server reports otherwise, servers that do not
+        #know the signal never do
+        if self._on_demand:
+            self._socket_worker.msg_tcp_sig_manager.send_signal(NodeSignals.OUT_Interest)
+
+        if self._scheduler:
+            self._scheduler.start()
+        return errors
 
-        def _message_process_loop():
-            while self._loop_condition():
-                (assignment, msg) = self._socket_worker.msg_queue.get(timeout=)
-                msg_type = MessageType(msg[self._MESSAGE_TYPE_INDEX])
+    def close(self):
+        if self._scheduler:
+            self._scheduler.stop()
 
-                if msg_type == MessageType.Common:
-                    msgr = self._msgrs_dict[msg[self._MESSENGER_ID_INDEX]]
-                    msgr.receive_request(msg)
-                    continue
+        for msgr in self._msgrs_dict.values():
+            if isinstance(msgr, messaging.TopicNode):
+                msgr.flush()
+
+        self._closed = True
+        for msgr in self._msgrs_dict.values():
+            if msgr._processes:
+                msgr._processes.close()
+        self._socket_worker.close()
+        get_persister().flush()
+
+    def _dispatch(self, assignment, msg):
+        msgr_routes = self._routes.get(msg[self._MESSAGE_TYPE_INDEX])
+
+        if msgr_routes is not None:
+            handler = msgr_routes.get(msg[self._MESSENGER_ID_INDEX])
+            if handler is None:
+                eprint('Message for unknown messenger: %r' % msg[self._MESSENGER_ID_INDEX])
+                return
+            handler(msg)
+            return
 
-                if msg_type == MessageType.NodeSignal:
-                    if assignment == self._socket_worker.MESSAGE_ASSIGNMENT_MESSANGER:
-                        self._socket_worker.msg_tcp_sig_manager.process_signal(msg)
-                        continue
+        if msg[self._MESSAGE_TYPE_INDEX] == MessageType.NodeSignal.value:
+            handler = self._signal_routes.get(assignment)
+            if handler is not None:
+                handler(msg)
+
+    #runs on the poll thread for every queued message
+    def _classify(self, assignment, msg):
+        msg_type = msg[self._MESSAGE_TYPE_INDEX]
+        if msg_type == MessageType.Common.value:
+            return InboundQueue.DATA
+
+        if msg_type == MessageType.Command.value:
+            msgr = self._msgrs_dict.get(msg[self._MESSENGER_ID_INDEX])
+            if msgr is not None and not msgr._is_system_command(msg):
+                return InboundQueue.USER_COMMAND
+            return InboundQueue.SYSTEM_COMMAND
+
+        return InboundQueue.SIGNAL
+
+    #runs on the poll thread for messages the inbound queue had no room for,
+    #callers of commands and requests get an error instead of waiting for a reply
+    def _reject(self, assignment, msg):
+        msg_type = msg[self._MESSAGE_TYPE_INDEX]
+        if msg_type == MessageType.Command.value:
+            call = CommandCodec.decode_command_call(msg)
+            self._socket_worker.send_command(CommandCodec.encode_command_error(call['command_id'], call['call_id'],
+                                                                               self._QUEUE_FULL_ERROR))
+            return
 
-                    if assignment == self._socket_worker.MESSAGE_ASSIGNMENT_COMMAND:
-                        self._socket_worker.cmd_sig_manager.process_signal(msg)
-                        continue
+        if msg_type == MessageType.Common.value:
+            msgr = self._msgrs_dict.get(msg[self._MESSENGER_ID_INDEX])
+            if isinstance(msgr, messaging.ServiceNode):
+                msgr._send(ROSMessageCodec.encode_error_msg(msgr.messenger_id, self._QUEUE_FULL_ERROR))
 
-                if msg_type == MessageType.Command:
-                    msgr = self._msgrs_dict[msg[self._MESSENGER_ID_INDEX]]
-                    msgr.process_command(msg)
-                    continue
+    def _on_interest(self, data=None):
+        if not data:
+            return
 
-        thread = Thread(target=_message_process_loop)
-        thread.start()
+        (active, messenger_ids) = NodeSignalsCodec.decode_interest(data)
+        for messenger_id in messenger_ids:
+            msgr = self._msgrs_dict.get(messenger_id)
+            if isinstance(msgr, messaging.TopicNode) and msgr.messenger_type == MessengerType.Topic:
+                msgr._set_active(active)
 
     def add_command(self, command):
         self._node_messenger.add_command(command)
 
+    def set_executor(self, executor):
+        self._node_messenger.set_executor(executor)
+
+    def set_command_executor(self, command, executor):
+        self._node_messenger.set_command_executor(command, executor)
+
     def set_param_on_change_callback(self, key, callback):
         if not self._node_messenger._params_mngr:
             raise Exception()
@@ -116,55 +279,234 @@ class RNode(object):
             if msgr.name == name:
                 return msgr
 
+    def get_metrics(self):
+        msg_queue = getattr(self._socket_worker, 'msg_queue', None)
+        messengers = {}
+        #names do not have to be unique, the hex messenger id tells messengers apart
+        for msgr in self._msgrs_dict.values():
+            key = '%s#%s' % (msgr.name or 'node', hexlify(msgr.messenger_id))
+            snapshot = messengers[key] = msgr.metrics.snapshot()
+            snapshot['pending'] = msgr.pending
+
+        return {'node': self._name,
+                'queue_depth': msg_queue.qsize() if msg_queue else 0,
+                'queue_high_water': getattr(self._socket_worker, 'queue_high_water', 0),
+                'datagrams_dropped': getattr(self._socket_worker, 'datagrams_dropped', 0),
+                'outbox_dropped': getattr(self._socket_worker, 'outbox_dropped', 0),
+                #shared by the nodes of a host
+                'inbound': msg_queue.snapshot() if msg_queue else {},
+                'periodic': [task.snapshot() for task in self._scheduler.tasks] if self._scheduler else [],
+                'messengers': messengers}
+
+    def reset_metrics(self):
+        for msgr in self._msgrs_dict.values():
+            msgr.metrics.reset()
+
+        msg_queue = getattr(self._socket_worker, 'msg_queue', None)
+        if msg_queue:
+            msg_queue.reset()
+
+        if self._scheduler:
+            for task in self._scheduler.tasks:
+                task.reset()
+
+    #'producer()' is called 'rate_hz' times a second by the node's scheduler thread and
+    #its result is sent with messenger.send_reply(), None skips the period.
+    #producers of all tasks share one thread and should return quickly.
+    #returns a task for remove_periodic(), runs start with the node
+    def add_periodic(self, messenger, rate_hz, producer, overrun_policy=OverrunPolicy.Skip):
+        if self._scheduler is None:
+            self._scheduler = PublishScheduler('%s-scheduler' % self._name)
+
+        task = self._scheduler.add(messenger, rate_hz, producer, overrun_policy)
+        if self._msg_process_loop_started and not self._closed:
+            self._scheduler.start()
+        return task
+
+    def remove_periodic(self, task):
+        if self._scheduler:
+            self._scheduler.remove(task)
+
+    @command('GetStats',
+             description='Get node statistics',
+             repl=[MessageValueType.string],
+             usage=CommandUsage.System)
+    def _get_statistics(self):
+        return json.dumps(self.get_metrics(), sort_keys=True)
+
+    #'on_done(messenger, error)' is called once the server acknowledges the initialization,
+    #messenger is None for the node itself
+    def _send_initialization(self, messenger, on_done):
+        key = None if messenger is None else messenger.messenger_id
+        with self._init_lock:
+            self._pending_inits[key] = (messenger, on_done)
+            try:
+                if messenger is None:
+                    self._socket_worker.send_message_tcp(NodeMessageCodec.encode_node_initialization(self._name,
+                                                                                                     self._messenger_id_width))
+                else:
+                    messenger._send_initialization()
+            except Exception as error:
+                self._pending_inits.pop(key, None)
+                if messenger is not None:
+                    messenger.init_error = error
+                on_done(messenger, error)
+
+    def _on_initialization_ack(self, data=None):
+        messenger_id = NodeMessageCodec.decode_messenger_initialization_ack(data)
+        with self._init_lock:
+            if messenger_id is not None:
+                pending = self._pending_inits.pop(messenger_id, None)
+            elif None in self._pending_inits:
+                pending = self._pending_inits.pop(None)
+            elif self._pending_inits:
+                #servers acking without the messenger id answer in order
+                pending = self._pending_inits.popitem(last=False)[1]
+            else:
+                pending = None
+
+        if pending is None:
+            #the wait for it expired, the messenger is still usable
+            messenger = self._msgrs_dict.get(messenger_id)
+            if messenger is not None and not messenger.is_initialized:
+                messenger.init_error = None
+                messenger._send_commands_initialization()
+            return
+
+        (messenger, on_done) = pending
+        if messenger is None:
+            accepted_width = NodeMessageCodec.decode_node_initialization_ack(data)
+            if accepted_width != self._messenger_id_width:
+                on_done(None, Exception('Server does not support %i byte messenger ids' % self._messenger_id_width))
+                return
+        else:
+            messenger.init_error = None
+            messenger._send_commands_initialization()
+
+        on_done(messenger, None)
+
+    def _send_messengers_initialization(self, messengers):
+        group = _InitializationGroup(len(messengers))
+        for msgr in messengers:
+            self._send_initialization(msgr, group.done)
+        return group
+
+    #returns {messenger name: error} of messengers that failed or were not acknowledged in time,
+    #late acknowledgements still initialize them
+    def _wait_messengers_initialization(self, messengers, group, deadline):
+        group.wait(deadline)
+
+        failed = {}
+        for msgr in messengers:
+            if not msgr.is_initialized and msgr.init_error is None:
+                self._cancel_initialization(msgr.messenger_id)
+                msgr.init_error = Exception('Initialization timed out')
+            if msgr.init_error is not None:
+                name = msgr.name or 'node'
+                eprint('Messenger %s was not initialized: %s' % (name, msgr.init_error))
+                failed[name] = msgr.init_error
+        return failed
+
+    def _cancel_initialization(self, messenger_id):
+        with self._init_lock:
+            self._pending_inits.pop(messenger_id, None)
+
+    #a fork copies only the calling thread, locks held by the others stay locked in the child.
+    #worker processes are forked before the threads of the host, the parameter persister
+    #and the executors start, the scheduler only starts after the node. Threads of the
+    #application are up to the caller
+    def _check_fork(self):
+        running = []
+        if self._socket_worker.host.started:
+            running.append('the node host is polling')
+        if get_persister().started:
+            running.append('the parameter persister is writing')
+        for msgr in self._msgrs_dict.values():
+            executors = [msgr._commands_mngr.executor] + msgr._commands_mngr._command_executors.values()
+            if any(started_threads(executor) for executor in executors if executor is not None):
+                running.append('executors of %s started their threads' % (msgr.name or 'node'))
+
+        if running:
+            raise Exception('Worker processes of node %s have to be forked before any node sharing its host '
+                            'starts and before executors are used: %s' % (self._name, ', '.join(running)))
+
+    def _next_messenger_id(self):
+        if self._messenger_id_cnt >= self._messenger_id_limit:
+            raise Exception('Too many messengers for %i byte messenger ids' % self._messenger_id_width)
+        return pack(self._messenger_id_format, self._messenger_id_cnt)
+
+    def _drop_message(self, msg):
+        pass
+
+    def _add_messenger(self, messenger):
+        messenger.metrics.enabled = self._metrics_enabled
+        if messenger._params_mngr and self._param_save_delay is not None:
+            messenger._params_mngr.save_delay = self._param_save_delay
+        self._msgrs_dict[messenger.messenger_id] = messenger
+        #messengers that take no requests drop them
+        self._routes[MessageType.Common.value][messenger.messenger_id] = getattr(messenger, 'receive_request',
+                                                                                 self._drop_message)
+        self._routes[MessageType.Command.value][messenger.messenger_id] = messenger.process_command
+        self._messenger_id_cnt += 1
+
+    def _register_messenger(self, messenger):
+        if messenger._processes:
+            self._check_fork()
+        self._add_messenger(messenger)
+
+        if(self._msg_process_loop_started):
+            if messenger._processes:
+                messenger._processes.start(self._socket_worker.host)
+            group = self._send_messengers_initialization([messenger])
+            self._wait_messengers_initialization([messenger], group, time.time() + self._init_timeout)
+
     def def_raw_msgr(self, name, device_name, device_type,
                      param_in=None, param_out=None,
-                     transport_protocol=TransportProtocol.TCP):
-        msgr_id = pack('B', self._messenger_id_cnt)
+                     transport_protocol=TransportProtocol.TCP,
+                     zero_copy=False, buffer_pool=None):
+        msgr_id = self._next_messenger_id()
         raw_messenger = messaging.RawMessenger(self._node_id, msgr_id, 
                                                name, device_name, device_type,
                                                self._socket_worker, transport_protocol,
-                                               param_in, param_out)
-        self._msgrs_dict[msgr_id] = raw_messenger        
-        self._messenger_id_cnt += 1
-
-        if(self._msg_process_loop_started):
-            raw_messenger._initialize()
+                                               param_in, param_out,
+                                               zero_copy, buffer_pool)
+        self._register_messenger(raw_messenger)
 
         return raw_messenger
 
     def def_topic_msgr(self, name, device_name, device_type,
                        reply_type,
                        param_in=None, param_out=None,
-                       transport_protocol=TransportProtocol.TCP):
-        msgr_id = pack('B', self._messenger_id_cnt)
+                       transport_protocol=TransportProtocol.TCP,
+                       batch_size=0, batch_bytes=64 * 1024, batch_window=0.005):
+        msgr_id = self._next_messenger_id()
         topic_messenger = messaging.TopicNode(self._node_id, msgr_id, 
                                               name, device_name, device_type,
                                               self._socket_worker, transport_protocol,
                                               reply_type,
-                                              param_in, param_out)
-        self._msgrs_dict[msgr_id] = topic_messenger        
-        self._messenger_id_cnt += 1
-
-        if(self._msg_process_loop_started):
-            topic_messenger._initialize()
+                                              param_in, param_out,
+                                              batch_size, batch_bytes, batch_window)
+        self._register_messenger(topic_messenger)
 
         return topic_messenger
 
+    #processes - number of forked worker processes running request_callback and the
+    #            messenger's user commands, 0 runs them in this process. They are forked
+    #            by start(), so such messengers have to be defined before the node (or any
+    #            node sharing its host) starts
     def def_service_msgr(self, name, device_name, device_type,
                          reply_type, request_type, request_callback,
                          param_in=None, param_out=None,
-                         transport_protocol=TransportProtocol.TCP):
-        msgr_id = pack('B', self._messenger_id_cnt)
+                         transport_protocol=TransportProtocol.TCP,
+                         processes=0):
+        msgr_id = self._next_messenger_id()
         servive_messenger = messaging.ServiceNode(self._node_id, msgr_id, 
                                                   name, device_name, device_type,
                                                   self._socket_worker, transport_protocol, request_callback,
                                                   reply_type, request_type,
-                                                  param_in, param_out)
-        self._msgrs_dict[msgr_id] = servive_messenger        
-        self._messenger_id_cnt += 1
-
-        if(self._msg_process_loop_started):
-            servive_messenger._initialize()
+                                                  param_in, param_out,
+                                                  processes)
+        self._register_messenger(servive_messenger)
 
         return servive_messenger
 
@@ -187,9 +529,9 @@ class RNode(object):
     def main_tcp_endpoint(self):
         return self._socket_worker.main_tcp_endpoint
 
-    #@property
-    #def main_udp_endpoint(self):
-    #    return self._socket_worker.main_udp_endpoint
+    @property
+    def main_udp_endpoint(self):
+        return self._socket_worker.main_udp_endpoint
 
     @property
     def cmd_endpoint(self):
@@ -0,0 +1,170 @@
+from __future__ import print_function
+from itertools import product
+from struct import unpack
+from threading import Thread
+from timeit import default_timer
+import argparse
+import json
+import os
+import threading
+import time
+
+from enums import DeviceType
+from node_host import NodeHost
+from rnode import RNode
+from stub_server import StubServer, LatencyRecorder
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class LoadMessage(object):
+    def __init__(self, sent_at=0.0, payload=b''):
+        self.sent_at = sent_at
+        self.payload = payload
+
+    __slots__ = ['sent_at', 'payload']
+    _slot_types = ['float64', 'raw']
+
+_MAIN_ENDPOINT = 'tcp://127.0.0.1:25557'
+_CMD_ENDPOINT = 'tcp://127.0.0.1:25558'
+_UDP_ENDPOINT = 'udp://127.0.0.1:25557'
+
+def _cpu_time():
+    times = os.times()
+    return times[0] + times[1]
+
+def _max_rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#publishes round robin over the node's messengers, each one at rate_hz
+def _publish(messengers, rate_hz, payload, deadline):
+    period = 1.0 / (rate_hz * len(messengers))
+    next_send = default_timer()
+    sent = 0
+
+    while True:
+        now = default_timer()
+        if now >= deadline:
+            return sent
+
+        if now < next_send:
+            time.sleep(next_send - now)
+
+        messengers[sent % len(messengers)].send_reply(LoadMessage(default_timer(), payload))
+        sent += 1
+        next_send += period
+
+#one run: 'nodes' RNodes with 'messengers' topics each, every topic published at rate_hz
+def run_once(server, run_id, nodes, messengers, rate_hz, payload_size, duration, shared_host=False, batch_size=0,
+             **node_kwargs):
+    latency = LatencyRecorder()
+    received = [0]
+
+    def _on_publish(node, messenger, frames, received_at):
+        received[0] += 1
+        latency.add(received_at - unpack(b'd', frames[0])[0])
+
+    server.publish_callbacks = [_on_publish]
+
+    threads_before = threading.active_count()
+    rss_before = _max_rss_kb()
+
+    host = NodeHost(max_queue_size=4096) if shared_host else None
+    if host:
+        node_kwargs['host'] = host
+
+    rnodes = []
+    topics = []
+    for node_index in range(nodes):
+        rnode = RNode('ScalingNode%i_%i' % (run_id, node_index),
+                      main_tcp_endpoint=_MAIN_ENDPOINT, cmd_endpoint=_CMD_ENDPOINT,
+                      main_udp_endpoint=_UDP_ENDPOINT, **node_kwargs)
+        node_topics = [rnode.def_topic_msgr('Topic%i' % index, 'Device%i' % index, DeviceType.Nothing, LoadMessage,
+                                            batch_size=batch_size)
+                       for index in range(messengers)]
+        rnode.start()
+        rnodes.append(rnode)
+        topics.append(node_topics)
+
+    node_threads = threading.active_count() - threads_before
+    payload = b'\x00' * payload_size
+    deadline = default_timer() + duration
+    cpu_before = _cpu_time()
+    started = default_timer()
+
+    sent = []
+    publishers = [Thread(target=lambda t=node_topics: sent.append(_publish(t, rate_hz, payload, deadline)))
+                  for node_topics in topics]
+    for publisher in publishers:
+        publisher.start()
+    for publisher in publishers:
+        publisher.join()
+
+    #let in-flight messages arrive
+    time.sleep(0.2)
+    elapsed = default_timer() - started
+    cpu = _cpu_time() - cpu_before
+    rss_after = _max_rss_kb()
+
+    for rnode in rnodes:
+        rnode.close()
+    if host:
+        host.close()
+
+    summary = latency.summary()
+    return {'nodes': nodes,
+            'messengers': messengers,
+            'rate_hz': rate_hz,
+            'payload_size': payload_size,
+            'sent': sum(sent),
+            'received': received[0],
+            'throughput_msgs_per_s': received[0] / elapsed,
+            'latency_p50_us': summary['p50'] and summary['p50'] * 1e6,
+            'latency_p99_us': summary['p99'] and summary['p99'] * 1e6,
+            'latency_p999_us': summary['p999'] and summary['p999'] * 1e6,
+            'cpu_per_node_s': cpu / nodes,
+            'cpu_utilization': cpu / elapsed,
+            'threads_per_node': node_threads / float(nodes),
+            'max_rss_growth_kb': None if rss_before is None else rss_after - rss_before}
+
+def _int_list(value):
+    return [int(item) for item in value.split(',')]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='N nodes x M messengers scaling harness')
+    parser.add_argument('--nodes', type=_int_list, default=[1, 4, 16])
+    parser.add_argument('--messengers', type=_int_list, default=[1, 8])
+    parser.add_argument('--rates', type=_int_list, default=[10, 100])
+    parser.add_argument('--payloads', type=_int_list, default=[16, 4096])
+    parser.add_argument('--duration', type=float, default=2.0)
+    parser.add_argument('--inline-dispatch', action='store_true')
+    parser.add_argument('--shared-host', action='store_true', help='run all nodes of a run on one NodeHost')
+    parser.add_argument('--batch-size', type=int, default=0, help='publish in batches of this many messages')
+    parser.add_argument('--output', default=None, help='write results as JSON')
+    arguments = parser.parse_args()
+
+    server = StubServer(_MAIN_ENDPOINT, _CMD_ENDPOINT, _UDP_ENDPOINT)
+    server.start()
+
+    results = []
+    for run_id, (nodes, messengers, rate_hz, payload_size) in enumerate(product(arguments.nodes, arguments.messengers,
+                                                                                arguments.rates, arguments.payloads)):
+        result = run_once(server, run_id, nodes, messengers, rate_hz, payload_size, arguments.duration,
+                          shared_host=arguments.shared_host, batch_size=arguments.batch_size,
+                          inline_dispatch=arguments.inline_dispatch)
+        results.append(result)
+        print('%3i nodes x %3i msgrs @ %5i Hz %7i B: %9.0f msgs/s  p50 %8.1f us  p99 %8.1f us  '
+              'p999 %8.1f us  cpu/node %.3f s  threads/node %.1f' %
+              (nodes, messengers, rate_hz, payload_size, result['throughput_msgs_per_s'],
+               result['latency_p50_us'] or 0, result['latency_p99_us'] or 0, result['latency_p999_us'] or 0,
+               result['cpu_per_node_s'], result['threads_per_node']))
+
+    server.stop()
+
+    if arguments.output:
+        with open(arguments.output, 'w') as stream:
+            json.dump(results, stream, indent=2, sort_keys=True)
@@ -0,0 +1,38 @@
+from rnode import RNode
+from node_host import NodeHost
+from enums import DeviceType
+
+from time import sleep
+
+class ExampleMessage(object):
+    def __init__(self, val):
+        self.A = val
+
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+#two nodes sharing one zmq context and one pair of poll/process threads
+if __name__ == '__main__':
+    host = NodeHost()
+
+    nodes = []
+    topics = []
+    for i in range(2):
+        node = RNode('SharedHostNode%i' % i, host=host)
+        topics.append(node.def_topic_msgr('SharedTopic', 'SharedTopicDevice',
+                                          DeviceType.Nothing, ExampleMessage))
+        node.start()
+        nodes.append(node)
+
+    i = 0
+    try:
+        while True:
+            for topic in topics:
+                topic.send_reply(ExampleMessage(i))
+            i += 1
+            sleep(0.5)
+    finally:
+        for node in nodes:
+            node.close()
+        #a host passed to the nodes is not closed by them
+        host.close()
@@ -0,0 +1,527 @@
+from __future__ import print_function
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+from struct import pack, unpack
+from threading import Thread, Lock, Condition
+from timeit import default_timer
+import socket as udp
+
+import zmq
+
+from datagram_socket import DatagramSocket
+from enums import (CommandMessageSubtype, MessageSubtype, MessageType,
+                   NodeSignals, TransportProtocol)
+from msg_codecs import DatagramCodec, NodeMessageCodec, NodeSignalsCodec, ParamsCodec, ROSMessageCodec
+
+class LatencyRecorder(object):
+    def __init__(self):
+        self.samples = []
+        self._lock = Lock()
+
+    def add(self, latency):
+        with self._lock:
+            self.samples.append(latency)
+
+    def percentile(self, percent):
+        with self._lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100.0))]
+
+    def summary(self):
+        return {'count': len(self.samples),
+                'p50': self.percentile(50),
+                'p99': self.percentile(99),
+                'p999': self.percentile(99.9)}
+
+class StubCommand(object):
+    def __init__(self, frames):
+        self.msgr_id = frames[0]
+        self.id = unpack(b'i', frames[1])[0]
+        self.name = frames[2]
+        self.description = frames[3]
+        self.usage = frames[4]
+
+class StubMessenger(object):
+    def __init__(self, frames):
+        self.type = frames[0][0:1]
+        self.device_type = frames[0][1:2]
+        self.transport_protocol = TransportProtocol(frames[0][2:3])
+        self.name = frames[1]
+        self.device_name = frames[2]
+        self.id = frames[3]
+        self.description = frames[4:]
+        self.commands = {}
+
+        self.received = 0
+        self.received_bytes = 0
+        self.batches = 0
+        #requests the node answered with an error
+        self.errors = 0
+        self.pending_requests = deque()
+        self.listeners = 0
+
+class StubNode(object):
+    def __init__(self, identity, name):
+        self.identity = identity
+        self.name = name
+        self.messengers = {}
+        self.udp_address = None
+        self.unrouted = 0
+        #payload frames of the last unrouted messages, raw messengers send no messenger id
+        self.raw_messages = deque(maxlen=1024)
+        self.messenger_id_width = 1
+        #set once the node asked for IN_Interest updates
+        self.on_demand = False
+
+    def messenger(self, name_or_id):
+        if name_or_id in self.messengers:
+            return self.messengers[name_or_id]
+        for messenger in self.messengers.values():
+            if messenger.name == name_or_id:
+                return messenger
+        raise KeyError(name_or_id)
+
+#Fringe server stand-in speaking the node protocol over ROUTER sockets,
+#runs on its own thread (start()) or as a process (python stub_server.py)
+class StubServer(object):
+    MAIN = b'\x00'
+    CMD = b'\x01'
+    UDP = b'\x02'
+
+    def __init__(self,
+                 main_tcp_endpoint='tcp://127.0.0.1:5557',
+                 cmd_endpoint='tcp://127.0.0.1:5558',
+                 main_udp_endpoint='udp://127.0.0.1:5557',
+                 context=None):
+        self._context = context or zmq.Context.instance()
+        self._running = False
+        self._thread = None
+
+        self._main_socket = self._context.socket(zmq.ROUTER)
+        self._main_socket.setsockopt(zmq.LINGER, 0)
+        self._main_socket.bind(main_tcp_endpoint)
+
+        self._cmd_socket = self._context.socket(zmq.ROUTER)
+        self._cmd_socket.setsockopt(zmq.LINGER, 0)
+        self._cmd_socket.bind(cmd_endpoint)
+
+        self._udp_socket = None
+        if main_udp_endpoint:
+            self._udp_socket = udp.socket(udp.AF_INET, udp.SOCK_DGRAM)
+            self._udp_socket.bind(DatagramSocket.parse_endpoint(main_udp_endpoint))
+            self._udp_socket.setblocking(False)
+
+        #calls from other threads are queued for the server thread,
+        #which is woken up through this pair
+        control_endpoint = 'inproc://stub-server-%x' % id(self)
+        self._control_rx = self._context.socket(zmq.PAIR)
+        self._control_rx.bind(control_endpoint)
+        self._control_tx = self._context.socket(zmq.PAIR)
+        self._control_tx.connect(control_endpoint)
+        self._control_lock = Lock()
+        self._control_queue = deque()
+
+        self.nodes = {}
+        self._nodes_by_identity = {}
+        self._condition = Condition()
+
+        self._call_ids = count()
+        self._pending_calls = {}
+        self._pending_pings = {}
+        self._timers = []
+        self._timer_ids = count()
+
+        self.ping_latency = LatencyRecorder()
+        self.request_latency = LatencyRecorder()
+        self.command_latency = LatencyRecorder()
+        self.publish_callbacks = []
+        #messenger id widths nodes may ask for, other widths get the plain ack of a 1 byte id server
+        self.messenger_id_widths = (1, 2, 4)
+
+    #region lifecycle
+
+    def start(self):
+        self._running = True
+        self._thread = Thread(target=self._loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+
+        self._control_tx.close()
+        self._control_rx.close()
+        self._main_socket.close()
+        self._cmd_socket.close()
+        if self._udp_socket:
+            self._udp_socket.close()
+
+    def wait_for_node(self, name, messengers=0, timeout=5.0):
+        deadline = default_timer() + timeout
+        with self._condition:
+            while True:
+                node = self.nodes.get(name)
+                if node is not None and len(node.messengers) >= messengers:
+                    return node
+
+                remaining = deadline - default_timer()
+                if remaining <= 0:
+                    raise Exception('Node %s was not initialized' % name)
+                self._condition.wait(remaining)
+
+    #endregion
+
+    #region requests
+
+    def ping(self, node_name, channel=MAIN, timeout=1.0):
+        return self._call(node_name, channel, lambda node, reply: self._send_ping(node, channel, reply), timeout)
+
+    def call_command(self, node_name, messenger, command_name, args=(), timeout=1.0):
+        def _send(node, reply):
+            msgr = node.messenger(messenger)
+            command = [cmd for cmd in msgr.commands.values() if cmd.name == command_name][0]
+            self._send_command_call(node, msgr, command, list(args), reply)
+        return self._call(node_name, self.CMD, _send, timeout)
+
+    def get_parameters_info(self, node_name, messenger=b'\x00', timeout=1.0):
+        return self.call_command(node_name, messenger, 'GetParInf', timeout=timeout)
+
+    #returns (epoch, version, [(parameter index, changes, packed value)])
+    def get_parameters_changes(self, node_name, since=0, messenger=b'\x00', timeout=1.0):
+        reply = self.call_command(node_name, messenger, 'GetParChg', [pack(b'I', since)], timeout)
+        return ParamsCodec.decode_params_changes(reply)
+
+    #changes are (parameter index, packed value) pairs
+    def change_params(self, node_name, changes, messenger=b'\x00', timeout=1.0):
+        args = []
+        for index, value in changes:
+            args.extend([pack(b'i', index), value])
+        return self.call_command(node_name, messenger, 'ChPar', args, timeout)
+
+    def request(self, node_name, messenger, frames, timeout=1.0):
+        def _send(node, reply):
+            self._send_request(node, node.messenger(messenger), frames, reply)
+        return self._call(node_name, self.MAIN, _send, timeout)
+
+    #sends 'total' requests at 'rate_hz' from the server thread, latencies end up in
+    #request_latency, command_latency or ping_latency depending on kind
+    def generate_load(self, node_name, rate_hz, total, kind='request', messenger=None, frames=(),
+                      command_name=None):
+        period = 1.0 / rate_hz
+        sent = [0]
+
+        def _tick():
+            node = self.nodes[node_name]
+            if kind == 'request':
+                self._send_request(node, node.messenger(messenger), list(frames), None)
+            elif kind == 'command':
+                msgr = node.messenger(messenger)
+                command = [cmd for cmd in msgr.commands.values() if cmd.name == command_name][0]
+                self._send_command_call(node, msgr, command, list(frames), None)
+            else:
+                self._send_ping(node, self.MAIN, None)
+
+            sent[0] += 1
+            return period if sent[0] < total else None
+
+        self._post(lambda: self._add_timer(0, _tick))
+
+    def on_publish(self, callback):
+        self.publish_callbacks.append(callback)
+
+    #adds a listener to a messenger, nodes started with on_demand learn about
+    #the first listener of a messenger and the last one leaving
+    def listen(self, node_name, messenger):
+        self._post(lambda: self._change_listeners(self.nodes[node_name], messenger, 1))
+
+    def unlisten(self, node_name, messenger):
+        self._post(lambda: self._change_listeners(self.nodes[node_name], messenger, -1))
+
+    #endregion
+
+    #region server thread
+
+    def _post(self, func):
+        with self._control_lock:
+            self._control_queue.append(func)
+            self._control_tx.send(b'')
+
+    def _call(self, node_name, channel, send, timeout):
+        condition = Condition()
+        result = []
+
+        def _reply(frames):
+            with condition:
+                result.append(frames)
+                condition.notify()
+
+        self._post(lambda: send(self.nodes[node_name], _reply))
+
+        with condition:
+            if not result:
+                condition.wait(timeout)
+        if not result:
+            raise Exception('No reply from %s' % node_name)
+        #error replies are raised
+        if isinstance(result[0], Exception):
+            raise result[0]
+        return result[0]
+
+    def _add_timer(self, delay, func):
+        heappush(self._timers, (default_timer() + delay, next(self._timer_ids), func))
+
+    def _run_timers(self):
+        now = default_timer()
+        while self._timers and self._timers[0][0] <= now:
+            (deadline, _, func) = heappop(self._timers)
+            delay = func()
+            if delay is not None:
+                heappush(self._timers, (deadline + delay, next(self._timer_ids), func))
+
+        if not self._timers:
+            return 64
+        return max(0, int((self._timers[0][0] - default_timer()) * 1000))
+
+    def _loop(self):
+        poller = zmq.Poller()
+        poller.register(self._main_socket, zmq.POLLIN)
+        poller.register(self._cmd_socket, zmq.POLLIN)
+        poller.register(self._control_rx, zmq.POLLIN)
+        if self._udp_socket:
+            poller.register(self._udp_socket, zmq.POLLIN)
+
+        while self._running:
+            timeout = self._run_timers()
+
+            for (socket, event) in poller.poll(timeout=timeout):
+                if socket is self._control_rx:
+                    self._control_rx.recv()
+                    self._control_queue.popleft()()
+                    continue
+
+                if socket is self._main_socket:
+                    self._on_main_message(self._main_socket.recv_multipart())
+                    continue
+
+                if socket is self._cmd_socket:
+                    self._on_cmd_message(self._cmd_socket.recv_multipart())
+                    continue
+
+                self._on_datagram()
+
+    def _send(self, channel, node, frames):
+        if channel == self.MAIN:
+            self._main_socket.send_multipart([node.identity] + frames)
+        elif channel == self.CMD:
+            self._cmd_socket.send_multipart([node.identity] + frames)
+        else:
+            datagram = DatagramCodec.encode_datagram(b'', frames)
+            self._udp_socket.sendto(datagram, node.udp_address)
+
+    def _send_signal(self, channel, node, signal, data=()):
+        self._send(channel, node, [MessageType.NodeSignal.value, signal.value] + list(data))
+
+    def _send_ping(self, node, channel, reply):
+        self._pending_pings.setdefault((node.identity, channel), deque()).append((default_timer(), reply))
+        self._send_signal(channel, node, NodeSignals.IN_Ping)
+
+    def _send_request(self, node, messenger, frames, reply):
+        messenger.pending_requests.append((default_timer(), reply))
+        self._send(self.MAIN, node,
+                   [MessageType.Common.value, MessageSubtype.Reply.value, messenger.id] + list(frames))
+
+    def _send_command_call(self, node, messenger, command, args, reply):
+        call_id = pack(b'I', next(self._call_ids))
+        self._pending_calls[call_id] = (default_timer(), reply)
+        self._send(self.CMD, node,
+                   [MessageType.Command.value, CommandMessageSubtype.Request.value, messenger.id,
+                    pack(b'i', command.id), call_id] + args)
+
+    def _change_listeners(self, node, messenger, delta):
+        messenger = node.messenger(messenger)
+        listened = messenger.listeners > 0
+        messenger.listeners = max(0, messenger.listeners + delta)
+
+        if node.on_demand and listened != (messenger.listeners > 0):
+            self._send_interest(node, not listened, [messenger.id])
+
+    def _send_interest(self, node, active, messenger_ids):
+        self._send_signal(self.MAIN, node, NodeSignals.IN_Interest,
+                          NodeSignalsCodec.encode_interest(active, messenger_ids))
+
+    def _register_node(self, identity, name):
+        node = StubNode(identity, name)
+        with self._condition:
+            self.nodes[name] = node
+            self._nodes_by_identity[identity] = node
+            self._condition.notify_all()
+        return node
+
+    def _on_main_message(self, frames):
+        identity, msg_type = frames[0], frames[1]
+
+        if msg_type == MessageType.NodeInitialization.value:
+            node = self._register_node(identity, frames[2])
+            if len(frames) > 3 and unpack(b'B', frames[3])[0] in self.messenger_id_widths:
+                node.messenger_id_width = unpack(b'B', frames[3])[0]
+                self._send_signal(self.MAIN, node, NodeSignals.IN_Null, frames[3:4])
+            else:
+                self._send_signal(self.MAIN, node, NodeSignals.IN_Null)
+            return
+
+        node = self._nodes_by_identity.get(identity)
+        if node is None:
+            return
+
+        if msg_type == MessageType.NodeSignal.value:
+            self._on_signal(node, self.MAIN, frames[2], frames[3:])
+            return
+
+        if msg_type == MessageType.Common.value:
+            self._on_common(node, frames[2:])
+
+    def _on_cmd_message(self, frames):
+        node = self._nodes_by_identity.get(frames[0])
+        if node is None:
+            return
+
+        if frames[1] == MessageType.NodeSignal.value:
+            self._on_signal(node, self.CMD, frames[2], frames[3:])
+            return
+
+        if frames[1] == MessageType.Command.value:
+            (started, reply) = self._pending_calls.pop(frames[4], (None, None))
+            if started is None:
+                return
+            self.command_latency.add(default_timer() - started)
+            if reply:
+                reply(Exception(frames[5]) if frames[3] == CommandMessageSubtype.Error.value else frames[5:])
+
+    def _on_datagram(self):
+        while True:
+            try:
+                (datagram, address) = self._udp_socket.recvfrom(DatagramSocket.MAX_DATAGRAM_SIZE)
+            except udp.error:
+                return
+
+            (identity, frames) = DatagramCodec.decode_datagram(datagram)
+            node = self._nodes_by_identity.get(identity)
+            if node is None:
+                continue
+
+            node.udp_address = address
+            if frames[0] == MessageType.NodeSignal.value:
+                self._on_signal(node, self.UDP, frames[1], frames[2:])
+            elif frames[0] == MessageType.Common.value:
+                self._on_common(node, frames[1:])
+
+    def _on_signal(self, node, channel, signal, data):
+        signal = NodeSignals(signal)
+
+        if signal == NodeSignals.OUT_MessangerInitialization:
+            messenger = StubMessenger(data)
+            with self._condition:
+                node.messengers[messenger.id] = messenger
+                self._condition.notify_all()
+            self._send_signal(self.MAIN, node, NodeSignals.IN_Null,
+                              NodeMessageCodec.encode_messenger_initialization_ack(messenger.id))
+            if node.on_demand:
+                self._send_interest(node, False, [messenger.id])
+            return
+
+        if signal == NodeSignals.OUT_Interest:
+            node.on_demand = True
+            for active in (True, False):
+                ids = [msgr.id for msgr in node.messengers.values() if (msgr.listeners > 0) == active]
+                if ids:
+                    self._send_interest(node, active, ids)
+            return
+
+        if signal == NodeSignals.OUT_CommandInitialization:
+            command = StubCommand(data)
+            messenger = node.messengers.get(command.msgr_id)
+            if messenger is not None:
+                messenger.commands[command.id] = command
+            return
+
+        if signal == NodeSignals.OUT_Pong:
+            pending = self._pending_pings.get((node.identity, channel))
+            if pending:
+                (started, reply) = pending.popleft()
+                self.ping_latency.add(default_timer() - started)
+                if reply:
+                    reply(default_timer() - started)
+
+    def _on_common(self, node, frames):
+        received_at = default_timer()
+        #raw messages carry no messenger id
+        messenger = node.messengers.get(frames[1]) if len(frames) > 1 else None
+        if messenger is None:
+            node.unrouted += 1
+            node.raw_messages.append(frames[1:])
+            return
+
+        messenger.received_bytes += sum(len(frame) for frame in frames)
+
+        #each message of a batch is published on its own
+        if frames[0] == MessageSubtype.Batch.value:
+            messages = ROSMessageCodec.decode_batch_msg(frames[2:])
+            messenger.received += len(messages)
+            messenger.batches += 1
+            for message in messages:
+                for callback in self.publish_callbacks:
+                    callback(node, messenger, message, received_at)
+            return
+
+        messenger.received += 1
+        error = frames[0] == MessageSubtype.Error.value
+        if error:
+            messenger.errors += 1
+        if messenger.pending_requests:
+            (started, reply) = messenger.pending_requests.popleft()
+            self.request_latency.add(received_at - started)
+            if reply:
+                reply(Exception(frames[2]) if error else frames[2:])
+            return
+        if error:
+            return
+
+        for callback in self.publish_callbacks:
+            callback(node, messenger, frames[2:], received_at)
+
+    #endregion
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Fringe server stand-in')
+    parser.add_argument('--main', default='tcp://127.0.0.1:5557')
+    parser.add_argument('--cmd', default='tcp://127.0.0.1:5558')
+    parser.add_argument('--udp', default='udp://127.0.0.1:5557')
+    parser.add_argument('--ping-period', type=float, default=1.0)
+    arguments = parser.parse_args()
+
+    server = StubServer(arguments.main, arguments.cmd, arguments.udp)
+    server.start()
+
+    try:
+        while True:
+            time.sleep(arguments.ping_period)
+            for name in list(server.nodes):
+                try:
+                    server.ping(name)
+                except Exception as error:
+                    print(error)
+
+            for node in server.nodes.values():
+                print('%s: %s' % (node.name, ', '.join('%s=%i' % (msgr.name or 'node', msgr.received)
+                                                       for msgr in node.messengers.values())))
+            print('ping %s' % server.ping_latency.summary())
+    except KeyboardInterrupt:
+        server.stop()
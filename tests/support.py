@@ -0,0 +1,59 @@
+#run from the repository root: python -m unittest discover -s tests
+import os
+import socket
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_server import StubServer
+
+def free_port(kind=socket.SOCK_STREAM):
+    probe = socket.socket(socket.AF_INET, kind)
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+#every test gets its own StubServer on free ports, nodes created
+#through create_node() are closed after the test
+class StubServerTestCase(unittest.TestCase):
+    use_udp = False
+
+    def setUp(self):
+        self.main_endpoint = 'tcp://127.0.0.1:%i' % free_port()
+        self.cmd_endpoint = 'tcp://127.0.0.1:%i' % free_port()
+        self.udp_endpoint = 'udp://127.0.0.1:%i' % free_port(socket.SOCK_DGRAM) if self.use_udp else None
+
+        self.server = StubServer(self.main_endpoint, self.cmd_endpoint, self.udp_endpoint)
+        self.server.start()
+        self._nodes = []
+
+    def tearDown(self):
+        for node in self._nodes:
+            node.close()
+        self.server.stop()
+
+    def create_node(self, name, **kwargs):
+        from rnode import RNode
+
+        kwargs.setdefault('main_tcp_endpoint', self.main_endpoint)
+        kwargs.setdefault('cmd_endpoint', self.cmd_endpoint)
+        kwargs.setdefault('main_udp_endpoint', self.udp_endpoint)
+        kwargs.setdefault('init_timeout', 2.0)
+        node = RNode(name, **kwargs)
+        self._nodes.append(node)
+        return node
+
+    def start_node(self, node, name, messengers):
+        node.start()
+        return self.server.wait_for_node(name, messengers)
@@ -0,0 +1,86 @@
+from struct import unpack
+import unittest
+
+from tornado import ioloop
+
+import support
+from async_rnode import AsyncRNode
+from enums import BackpressurePolicy, DeviceType, SendStatus
+from metrics import MessengerMetrics
+from outgoing_queue import OutgoingQueue
+
+class Sample(object):
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+    def __init__(self, a=0):
+        self.A = a
+
+class OutgoingQueueTest(unittest.TestCase):
+    def create_queue(self, policy, hwm, sent=None):
+        self.scheduled = []
+        self.metrics = MessengerMetrics()
+        try_send = (lambda msg: sent.append(msg) or True) if sent is not None else (lambda msg: False)
+        return OutgoingQueue(policy, hwm, try_send,
+                             lambda delay, func: self.scheduled.append(func),
+                             lambda: False, self.metrics)
+
+    def test_drop_newest_beyond_hwm(self):
+        queue = self.create_queue(BackpressurePolicy.DropNewest, 2)
+        statuses = [queue.put(i) for i in range(3)]
+
+        self.assertEqual(statuses, [SendStatus.Queued, SendStatus.Queued, SendStatus.Dropped])
+        self.assertEqual(queue.depth, 2)
+        self.assertEqual(self.metrics.dropped, 1)
+
+    def test_keep_latest_replaces_queued(self):
+        queue = self.create_queue(BackpressurePolicy.KeepLatest, 10)
+        queue.put(1)
+
+        self.assertEqual(queue.put(2), SendStatus.Replaced)
+        self.assertEqual(list(queue._queue), [2])
+
+    def test_drain_sends_a_limited_batch(self):
+        sent = []
+        queue = self.create_queue(BackpressurePolicy.DropOldest, 1000, sent)
+        for i in range(OutgoingQueue.MAX_SEND_BATCH + 10):
+            queue.put(i)
+        self.assertEqual(len(self.scheduled), 1)
+
+        self.assertIsNone(self.scheduled.pop()())
+        self.assertEqual(len(sent), OutgoingQueue.MAX_SEND_BATCH)
+        #the rest waits for the next turn of the poll loop
+        self.assertEqual(len(self.scheduled), 1)
+
+        self.scheduled.pop()()
+        self.assertEqual(sent, range(OutgoingQueue.MAX_SEND_BATCH + 10))
+        self.assertEqual(queue.depth, 0)
+
+class BackpressureTest(support.StubServerTestCase):
+    def test_queued_messages_reach_server(self):
+        node = self.create_node('QueueNode')
+        topic = node.def_topic_msgr('Queued', 'Dev', DeviceType.Nothing, Sample)
+        topic.set_backpressure_policy(BackpressurePolicy.DropOldest, 1000)
+        self.start_node(node, 'QueueNode', 2)
+
+        received = []
+        self.server.on_publish(lambda node, messenger, message, received_at:
+                               received.append(unpack('i', message[0])[0]))
+        for i in range(600):
+            self.assertEqual(topic.send_reply(Sample(i)), SendStatus.Queued)
+
+        self.assertTrue(support.wait_until(lambda: len(received) == 600))
+        self.assertEqual(received, range(600))
+
+    def test_async_node_refuses_policies(self):
+        node = AsyncRNode('AsyncNode', io_loop=ioloop.IOLoop(),
+                          main_tcp_endpoint=self.main_endpoint, cmd_endpoint=self.cmd_endpoint)
+        try:
+            topic = node.def_topic_msgr('Queued', 'Dev', DeviceType.Nothing, Sample)
+            with self.assertRaises(Exception):
+                topic.set_backpressure_policy(BackpressurePolicy.DropNewest)
+        finally:
+            node.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from struct import pack
+
+import support
+from enums import MessageValueType
+from msg_codecs import Parameter, ParamsCodec
+
+class ParamsChangesCodecTest(unittest.TestCase):
+    def test_list_values_round_trip(self):
+        scalar = Parameter('gain', 0, param_type=MessageValueType.int32, value=5)
+        array = Parameter('lut', 1, param_type=MessageValueType.raw, value=[b'\x01', b'\x02\x03', b'\x04'])
+        last = Parameter('name', 2, param_type=MessageValueType.string, value=b'probe')
+        scalar.changes, array.changes, last.changes = 1, 2, 3
+
+        frames = ParamsCodec.encode_params_changes(7, 9, [scalar, array, last])
+        (epoch, version, changes) = ParamsCodec.decode_params_changes(frames)
+
+        self.assertEqual((epoch, version), (7, 9))
+        self.assertEqual(changes, [(0, 1, pack('i', 5)),
+                                   (1, 2, [b'\x01', b'\x02\x03', b'\x04']),
+                                   (2, 3, b'probe')])
+
+    def test_info_and_changes_share_the_list_encoding(self):
+        array = Parameter('lut', 1, param_type=MessageValueType.raw, value=[b'\x01', b'\x02'], flags=0)
+        info = ParamsCodec.encode_params_info([array])
+        changes = ParamsCodec.encode_params_changes(0, 0, [array])
+        self.assertEqual(info[-2:], changes[-2:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import array
+import unittest
+
+import support
+from datagram_socket import _frame_bytes
+from enums import DeviceType, TransportProtocol
+
+class FrameBytesTest(unittest.TestCase):
+    def test_buffer_like_frames_keep_their_content(self):
+        self.assertEqual(_frame_bytes(b'abc'), b'abc')
+        self.assertEqual(_frame_bytes(bytearray(b'abc')), b'abc')
+        self.assertEqual(_frame_bytes(memoryview(bytearray(b'abcdef'))[:3]), b'abc')
+        self.assertEqual(_frame_bytes(array.array('B', [1, 2, 3])), b'\x01\x02\x03')
+
+class UdpTransportTest(support.StubServerTestCase):
+    use_udp = True
+
+    def test_pooled_buffer_goes_out_unchanged(self):
+        node = self.create_node('UdpNode')
+        raw = node.def_raw_msgr('Raw', 'Dev', DeviceType.Nothing,
+                                transport_protocol=TransportProtocol.UDP, zero_copy=True)
+        self.start_node(node, 'UdpNode', 2)
+
+        payload = b'pooled payload'
+        buffer = raw.acquire_buffer(len(payload))
+        buffer[:len(payload)] = payload
+        #the server learns the node address from the first datagram
+        self.assertTrue(support.wait_until(lambda: self.server.nodes['UdpNode'].udp_address is not None))
+        raw.send_buffer(buffer, len(payload))
+
+        raw_messages = self.server.nodes['UdpNode'].raw_messages
+        self.assertTrue(support.wait_until(lambda: raw_messages))
+        self.assertEqual(raw_messages[0], [payload])
+
+class UdpOptInTest(support.StubServerTestCase):
+    def test_nodes_without_udp_endpoint_open_no_datagram_socket(self):
+        from rnode import RNode
+        node = RNode('TcpNode', main_tcp_endpoint=self.main_endpoint, cmd_endpoint=self.cmd_endpoint)
+        self._nodes.append(node)
+        self.start_node(node, 'TcpNode', 1)
+
+        self.assertIsNone(node.main_udp_endpoint)
+        self.assertIsNone(self.server.nodes['TcpNode'].udp_address)
+
+if __name__ == '__main__':
+    unittest.main()
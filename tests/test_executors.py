@@ -0,0 +1,61 @@
+import unittest
+
+from concurrent.futures import Future
+
+import support
+from command_manager import command, CommandManager
+from enums import MessageValueType
+from executors import CallbackExecutor
+
+@command('Double', [MessageValueType.int32], 'Double an integer', [MessageValueType.int32])
+def double(value):
+    return value * 2
+
+class Calculator(object):
+    @command('Add', [MessageValueType.int32, MessageValueType.int32], 'Add two integers', [MessageValueType.int32])
+    def add(self, a, b):
+        return a + b
+
+class CallbackExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.threads = CallbackExecutor(2)
+        self.processes = CallbackExecutor(2, processes=True)
+
+    def tearDown(self):
+        self.threads.shutdown()
+        self.processes.shutdown()
+
+    def test_submit_returns_future(self):
+        future = self.processes.submit(double, 21)
+        self.assertIsInstance(future, Future)
+        self.assertEqual(future.result(timeout=5), 42)
+
+    def test_errors_reach_the_future(self):
+        future = self.threads.submit(lambda: 1 / 0)
+        self.assertRaises(ZeroDivisionError, future.result, 5)
+
+    def test_calls_over_the_limit_wait(self):
+        executor = CallbackExecutor(1, max_concurrency=1)
+        futures = [executor.submit(lambda value=value: value) for value in range(5)]
+        self.assertEqual([future.result(timeout=5) for future in futures], range(5))
+        executor.shutdown()
+
+    def test_process_pool_rejects_bound_methods(self):
+        manager = CommandManager()
+        manager.register_command(Calculator().add, b'\x00')
+        self.assertRaises(Exception, manager.set_executor, self.processes)
+        self.assertIsNone(manager.executor)
+
+        manager = CommandManager()
+        manager.set_executor(self.processes)
+        manager.register_command(double, b'\x00')
+        self.assertRaises(Exception, manager.register_command, Calculator().add, b'\x00')
+
+    def test_thread_pool_takes_bound_methods(self):
+        manager = CommandManager()
+        manager.register_command(Calculator().add, b'\x00')
+        manager.set_executor(self.threads)
+        self.assertIs(manager.executor, self.threads)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+from struct import pack
+from threading import Event, Thread
+import unittest
+
+import support
+from command_manager import command
+from enums import DeviceType, MessageValueType
+from inbound_queue import InboundQueue
+
+class Sample(object):
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+    def __init__(self, a=0):
+        self.A = a
+
+class Blocker(object):
+    def __init__(self):
+        self.entered = Event()
+        self.release = Event()
+
+    def wait(self, request=None):
+        self.entered.set()
+        self.release.wait(5.0)
+        return request
+
+    @command('Wait', [], 'Wait until released', [MessageValueType.int32])
+    def wait_command(self):
+        self.wait()
+        return 1
+
+class InboundQueueTest(unittest.TestCase):
+    def test_full_class_drops(self):
+        queue = InboundQueue(1)
+
+        self.assertTrue(queue.put('first'))
+        self.assertFalse(queue.put('second'))
+        self.assertEqual(queue.dropped[InboundQueue.DATA], 1)
+
+    def test_signals_are_never_dropped(self):
+        queue = InboundQueue(1)
+
+        self.assertTrue(all(queue.put(i, InboundQueue.SIGNAL) for i in range(10)))
+        self.assertEqual(queue.dropped[InboundQueue.SIGNAL], 0)
+        self.assertEqual(queue.qsize(), 10)
+
+class RejectTest(support.StubServerTestCase):
+    def setUp(self):
+        super(RejectTest, self).setUp()
+        self.blocker = Blocker()
+
+    def tearDown(self):
+        self.blocker.release.set()
+        super(RejectTest, self).tearDown()
+
+    def test_dropped_request_gets_error(self):
+        node = self.create_node('RejectNode', max_queue_size=1)
+        node.def_service_msgr('Slow', 'Dev', DeviceType.Nothing, Sample, Sample, self.blocker.wait)
+        self.start_node(node, 'RejectNode', 2)
+
+        self.server.generate_load('RejectNode', 1000, 1, messenger='Slow', frames=[pack('i', 1)])
+        self.assertTrue(self.blocker.entered.wait(2.0))
+        #one waits in the queue, the other one does not fit
+        self.server.generate_load('RejectNode', 1000, 2, messenger='Slow', frames=[pack('i', 1)])
+
+        messenger = self.server.nodes['RejectNode'].messenger('Slow')
+        self.assertTrue(support.wait_until(lambda: messenger.errors == 1))
+        self.blocker.release.set()
+        self.assertTrue(support.wait_until(lambda: messenger.received == 3))
+
+    def test_dropped_command_gets_error(self):
+        node = self.create_node('RejectNode', max_queue_size=1)
+        node.add_command(self.blocker.wait_command)
+        self.start_node(node, 'RejectNode', 1)
+
+        calls = [Thread(target=lambda: self.server.call_command('RejectNode', b'\x00', 'Wait', timeout=5.0))]
+        calls[0].start()
+        self.assertTrue(self.blocker.entered.wait(2.0))
+        calls.append(Thread(target=lambda: self.server.call_command('RejectNode', b'\x00', 'Wait', timeout=5.0)))
+        calls[1].start()
+        self.assertTrue(support.wait_until(lambda: node._socket_worker.msg_queue.qsize() == 1))
+
+        with self.assertRaises(Exception) as raised:
+            self.server.call_command('RejectNode', b'\x00', 'Wait')
+        self.assertIn('queue is full', str(raised.exception))
+
+        self.blocker.release.set()
+        for call in calls:
+            call.join()
+
+if __name__ == '__main__':
+    unittest.main()
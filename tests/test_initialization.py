@@ -0,0 +1,112 @@
+import time
+import unittest
+
+import support
+from enums import DeviceType
+from msg_codecs import NodeMessageCodec
+from rnode import _InitializationGroup
+
+class Sample(object):
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+    def __init__(self, a=0):
+        self.A = a
+
+class _FakeMessenger(object):
+    def __init__(self, messenger_id):
+        self.messenger_id = messenger_id
+        self.name = 'Fake'
+        self._processes = None
+        self.is_initialized = False
+        self.init_error = None
+
+    def _send_initialization(self):
+        pass
+
+    def _send_commands_initialization(self):
+        self.is_initialized = True
+
+class InitializationAckTest(support.StubServerTestCase):
+    def test_messengers_are_initialized(self):
+        node = self.create_node('InitNode')
+        topics = [node.def_topic_msgr('Topic%i' % i, 'Topic', DeviceType.Nothing, Sample) for i in range(5)]
+
+        self.assertEqual(node.start(), {})
+        self.assertTrue(all(topic.is_initialized for topic in topics))
+        self.assertEqual(len(node._pending_inits), 0)
+
+    def test_acks_are_matched_by_messenger_id(self):
+        node = self.create_node('InitNode')
+        first = _FakeMessenger(b'\x10')
+        second = _FakeMessenger(b'\x11')
+        acked = []
+        node._send_initialization(first, lambda msgr, error: acked.append(msgr))
+        node._send_initialization(second, lambda msgr, error: acked.append(msgr))
+
+        node._on_initialization_ack(NodeMessageCodec.encode_messenger_initialization_ack(second.messenger_id))
+        node._on_initialization_ack(NodeMessageCodec.encode_messenger_initialization_ack(first.messenger_id))
+
+        self.assertEqual(acked, [second, first])
+        self.assertTrue(first.is_initialized and second.is_initialized)
+
+    def test_expired_initialization_is_removed(self):
+        node = self.create_node('InitNode')
+        slow = _FakeMessenger(b'\x10')
+        other = _FakeMessenger(b'\x11')
+        group = _InitializationGroup(2)
+        for msgr in (slow, other):
+            node._msgrs_dict[msgr.messenger_id] = msgr
+            node._send_initialization(msgr, group.done)
+
+        failed = node._wait_messengers_initialization([slow, other], group, time.time())
+        self.assertEqual(set(failed), set(['Fake']))
+        self.assertEqual(len(node._pending_inits), 0)
+
+        #a late ack still initializes the messenger it names
+        node._on_initialization_ack(NodeMessageCodec.encode_messenger_initialization_ack(other.messenger_id))
+        self.assertTrue(other.is_initialized)
+        self.assertFalse(slow.is_initialized)
+
+class MessengerIdWidthTest(support.StubServerTestCase):
+    def test_widths_are_negotiated(self):
+        for width in (1, 2):
+            name = 'WidthNode%i' % width
+            node = self.create_node(name, messenger_id_width=width)
+            topic = node.def_topic_msgr('Topic', 'Topic', DeviceType.Nothing, Sample)
+            self.start_node(node, name, 2)
+
+            self.assertEqual(self.server.nodes[name].messenger_id_width, width)
+            self.assertEqual(len(topic.messenger_id), width)
+            self.assertTrue(topic.is_initialized)
+
+    def test_unsupported_width_is_refused(self):
+        with self.assertRaises(Exception):
+            self.create_node('WidthNode', messenger_id_width=3)
+
+    def test_server_refusing_width_fails_start(self):
+        self.server.messenger_id_widths = (1,)
+        node = self.create_node('WidthNode', messenger_id_width=2)
+        node.def_topic_msgr('Topic', 'Topic', DeviceType.Nothing, Sample)
+
+        with self.assertRaises(Exception) as context:
+            node.start()
+        self.assertIn('2 byte messenger ids', str(context.exception))
+
+    def test_too_many_messengers(self):
+        node = self.create_node('WidthNode')
+        for i in range(255):
+            node.def_topic_msgr('Topic%i' % i, 'Topic', DeviceType.Nothing, Sample)
+
+        with self.assertRaises(Exception) as context:
+            node.def_topic_msgr('Topic255', 'Topic', DeviceType.Nothing, Sample)
+        self.assertIn('Too many messengers', str(context.exception))
+        self.assertIsNone(node.get_defined_messenger('Topic255'))
+
+        wide = self.create_node('WideNode', messenger_id_width=2)
+        for i in range(256):
+            wide.def_topic_msgr('Topic%i' % i, 'Topic', DeviceType.Nothing, Sample)
+        self.assertEqual(len(wide.get_defined_messenger('Topic255').messenger_id), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import json
+import unittest
+
+import support
+from enums import DeviceType
+
+class Sample(object):
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+    def __init__(self, a=0):
+        self.A = a
+
+class MetricsTest(support.StubServerTestCase):
+    def test_metrics_are_off_by_default(self):
+        node = self.create_node('Quiet')
+        topic = node.def_topic_msgr('Topic', 'Dev', DeviceType.Nothing, Sample)
+        self.start_node(node, 'Quiet', 2)
+
+        topic.send_reply(Sample(1))
+        self.assertFalse(topic.metrics.enabled)
+        self.assertEqual(topic.metrics.sent, 0)
+
+    def test_messengers_with_the_same_name_are_reported_apart(self):
+        node = self.create_node('Counted', metrics=True)
+        first = node.def_topic_msgr('Twin', 'Dev', DeviceType.Nothing, Sample)
+        second = node.def_topic_msgr('Twin', 'Dev', DeviceType.Nothing, Sample)
+        self.start_node(node, 'Counted', 3)
+
+        first.send_reply(Sample(1))
+        for value in range(3):
+            second.send_reply(Sample(value))
+
+        messengers = node.get_metrics()['messengers']
+        twins = sorted(stats['sent'] for key, stats in messengers.items() if key.startswith('Twin#'))
+        self.assertEqual(twins, [1, 3])
+
+    def test_statistics_command(self):
+        node = self.create_node('Stats', metrics=True)
+        node.def_topic_msgr('Topic', 'Dev', DeviceType.Nothing, Sample)
+        self.start_node(node, 'Stats', 2)
+        self.assertTrue(support.wait_until(lambda: self.server.nodes['Stats'].messenger(b'\x00').commands))
+
+        reply = self.server.call_command('Stats', b'\x00', 'GetStats')
+        self.assertEqual(json.loads(reply[0])['node'], 'Stats')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+from struct import pack, unpack
+from threading import Thread, Event
+import time
+import unittest
+
+import support
+from enums import DeviceType
+from node_host import NodeHost
+from stub_server import StubServer
+
+class Sample(object):
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+    def __init__(self, a=0):
+        self.A = a
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+class SharedHostTestCase(support.StubServerTestCase):
+    def setUp(self):
+        super(SharedHostTestCase, self).setUp()
+        self.host = NodeHost()
+        self.other_main_endpoint = 'tcp://127.0.0.1:%i' % support.free_port()
+        self.other_cmd_endpoint = 'tcp://127.0.0.1:%i' % support.free_port()
+        self.other_server = StubServer(self.other_main_endpoint, self.other_cmd_endpoint)
+        self.other_server.start()
+
+    def tearDown(self):
+        super(SharedHostTestCase, self).tearDown()
+        self.other_server.stop()
+        self.host.close()
+
+    def create_other_node(self, name):
+        return self.create_node(name, host=self.host,
+                                main_tcp_endpoint=self.other_main_endpoint,
+                                cmd_endpoint=self.other_cmd_endpoint)
+
+class StalledServerTest(SharedHostTestCase):
+    def test_gone_server_does_not_stall_host(self):
+        stalled = self.create_other_node('StalledNode')
+        topic = stalled.def_topic_msgr('Flood', 'Dev', DeviceType.Nothing, Sample)
+        stalled.start()
+        self.other_server.wait_for_node('StalledNode', 2)
+        healthy = self.create_node('HealthyNode', host=self.host)
+        self.start_node(healthy, 'HealthyNode', 1)
+
+        self.other_server.stop()
+        for i in range(5000):
+            topic.send_reply(Sample(i))
+
+        self.assertTrue(support.wait_until(lambda: stalled._socket_worker.outbox_dropped > 0))
+        self.assertIsNotNone(self.server.ping('HealthyNode'))
+
+class SharedHostTest(SharedHostTestCase):
+    def test_nodes_answer_and_close_independently(self):
+        nodes = []
+        for name in ('FirstNode', 'SecondNode'):
+            node = self.create_node(name, host=self.host)
+            node.def_service_msgr('Echo', 'Dev', DeviceType.Nothing, Sample, Sample, lambda request: request)
+            self.start_node(node, name, 2)
+            nodes.append(node)
+
+        self.assertEqual(self.host.nodes_count, 2)
+        for (i, name) in enumerate(('FirstNode', 'SecondNode')):
+            reply = self.server.request(name, 'Echo', [pack('i', i)])
+            self.assertEqual(unpack('i', reply[0])[0], i)
+
+        nodes[0].close()
+        self.assertEqual(self.host.nodes_count, 1)
+        self.assertIsNotNone(self.server.ping('SecondNode'))
+        reply = self.server.request('SecondNode', 'Echo', [pack('i', 7)])
+        self.assertEqual(unpack('i', reply[0])[0], 7)
+
+class SendingThreadsTest(support.StubServerTestCase):
+    @unittest.skipUnless(os.path.isdir('/proc/self/fd'), 'needs /proc')
+    def test_short_lived_threads_do_not_leak_sockets(self):
+        node = self.create_node('ThreadsNode')
+        topic = node.def_topic_msgr('Topic', 'Dev', DeviceType.Nothing, Sample)
+        self.start_node(node, 'ThreadsNode', 2)
+        received = []
+        self.server.on_publish(lambda node, messenger, message, received_at: received.append(message))
+
+        fds = open_fds()
+        for i in range(300):
+            thread = Thread(target=topic.send_reply, args=(Sample(i),))
+            thread.start()
+            thread.join()
+
+        self.assertTrue(support.wait_until(lambda: len(received) == 300))
+        self.assertLess(open_fds() - fds, 10)
+
+class TimersTest(unittest.TestCase):
+    def setUp(self):
+        self.host = NodeHost()
+        self.host.start()
+
+    def tearDown(self):
+        self.host.close()
+
+    def test_repeating_timer(self):
+        calls = []
+        def _tick():
+            calls.append(None)
+            if len(calls) < 3:
+                return 0.01
+        self.host.call_later(0.01, _tick)
+
+        self.assertTrue(support.wait_until(lambda: len(calls) == 3))
+        time.sleep(0.05)
+        self.assertEqual(len(calls), 3)
+
+    def test_wall_clock_step_does_not_delay_timers(self):
+        fired = Event()
+        self.host.call_later(0.05, fired.set)
+        original = time.time
+        #the system clock is set back an hour right after the timer is armed
+        time.time = lambda: original() - 3600
+        try:
+            self.assertTrue(fired.wait(1.0))
+        finally:
+            time.time = original
+
+if __name__ == '__main__':
+    unittest.main()
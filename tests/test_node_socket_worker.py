@@ -0,0 +1,92 @@
+from struct import pack, unpack
+import threading
+import unittest
+
+import zmq
+
+import support
+from enums import DeviceType
+from node_host import NodeHost
+from node_socket_worker import NodeSocketWorker
+
+class Sample(object):
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+    def __init__(self, a=0):
+        self.A = a
+
+class DispatchThreadTest(support.StubServerTestCase):
+    def served_on(self, **kwargs):
+        threads = []
+        def _echo(request):
+            threads.append(threading.current_thread().name)
+            return request
+
+        node = self.create_node('DispatchNode', **kwargs)
+        node.def_service_msgr('Echo', 'Dev', DeviceType.Nothing, Sample, Sample, _echo)
+        self.start_node(node, 'DispatchNode', 2)
+
+        reply = self.server.request('DispatchNode', 'Echo', [pack('i', 3)])
+        self.assertEqual(unpack('i', reply[0])[0], 3)
+        return threads
+
+    def test_inline_dispatch_runs_on_poll_thread(self):
+        self.assertEqual(self.served_on(inline_dispatch=True), ['node-host-poll'])
+
+    def test_queued_dispatch_runs_on_process_thread(self):
+        self.assertEqual(self.served_on(), ['node-host-process'])
+
+class ReceiveFairnessTest(unittest.TestCase):
+    def setUp(self):
+        self.context = zmq.Context()
+        self.host = NodeHost(context=self.context)
+        self.worker = NodeSocketWorker(b'FairNode', 'tcp://127.0.0.1:1', 'tcp://127.0.0.1:2',
+                                       lambda: True, host=self.host)
+        self.sockets = []
+
+    def tearDown(self):
+        self.worker.close()
+        self.host.close()
+        for socket in self.sockets:
+            socket.close()
+        self.context.term()
+
+    #returns the receiving end of a socket pair holding 'count' messages
+    def filled_pair(self, name, count):
+        (receiver, sender) = (self.context.socket(zmq.PAIR), self.context.socket(zmq.PAIR))
+        self.sockets.extend((receiver, sender))
+        receiver.setsockopt(zmq.RCVHWM, 0)
+        sender.setsockopt(zmq.SNDHWM, 0)
+        receiver.bind('inproc://fairness-%s' % name)
+        sender.connect('inproc://fairness-%s' % name)
+        for i in range(count):
+            sender.send(name)
+        return receiver
+
+    def test_busy_socket_does_not_starve_others(self):
+        busy_count = NodeSocketWorker.MAX_RECV_BATCH * 4
+        busy = self.filled_pair(b'busy', busy_count)
+        cmd = self.filled_pair(b'cmd', 1)
+        delivered = []
+        self.worker._deliver = lambda assignment, msg: delivered.append(msg[0])
+
+        self.host.register(busy, lambda: self.worker._recv_batch(busy, NodeSocketWorker.MESSAGE_ASSIGNMENT_MESSANGER))
+        self.host.register(cmd, lambda: self.worker._recv_batch(cmd, NodeSocketWorker.MESSAGE_ASSIGNMENT_COMMAND))
+        self.host.start()
+
+        self.assertTrue(support.wait_until(lambda: len(delivered) == busy_count + 1))
+        self.assertLessEqual(delivered.index(b'cmd'), NodeSocketWorker.MAX_RECV_BATCH)
+
+    def test_batch_is_bounded(self):
+        busy = self.filled_pair(b'busy', NodeSocketWorker.MAX_RECV_BATCH + 10)
+        delivered = []
+        self.worker._deliver = lambda assignment, msg: delivered.append(msg[0])
+
+        self.worker._recv_batch(busy, NodeSocketWorker.MESSAGE_ASSIGNMENT_MESSANGER)
+        self.assertEqual(len(delivered), NodeSocketWorker.MAX_RECV_BATCH)
+        self.worker._recv_batch(busy, NodeSocketWorker.MESSAGE_ASSIGNMENT_MESSANGER)
+        self.assertEqual(len(delivered), NodeSocketWorker.MAX_RECV_BATCH + 10)
+
+if __name__ == '__main__':
+    unittest.main()
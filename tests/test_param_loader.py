@@ -0,0 +1,80 @@
+import cPickle as pickle
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+import param_loader
+from param_loader import CACHE_SUFFIX, load_params_info
+
+_PARAM = 'speed:\n  description: speed limit\n  flags: 0\n  type: int32\n  value: %s\n'
+
+class ParamsCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'params.yaml')
+        self.write(5)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, value, mtime=None):
+        with open(self.path, 'w') as params_file:
+            params_file.write(_PARAM % value)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def value(self):
+        (params, info) = load_params_info(self.path)
+        return params.values()[0].value
+
+    def test_warm_start_does_not_parse_yaml(self):
+        self.assertEqual(self.value(), 5)
+        self.assertTrue(os.path.exists(self.path + CACHE_SUFFIX))
+
+        original = param_loader.load
+        def _load(*args, **kwargs):
+            raise AssertionError('yaml parsed on a warm start')
+        param_loader.load = _load
+        try:
+            self.assertEqual(self.value(), 5)
+        finally:
+            param_loader.load = original
+
+    def test_changed_size_invalidates_cache(self):
+        self.assertEqual(self.value(), 5)
+        self.write(123)
+
+        self.assertEqual(self.value(), 123)
+
+    def test_changed_mtime_invalidates_cache(self):
+        self.write(5, mtime=1000000000)
+        self.assertEqual(self.value(), 5)
+        #same size, only the modification time tells the files apart
+        self.write(7, mtime=1000000010)
+
+        self.assertEqual(self.value(), 7)
+
+    def test_corrupt_cache_falls_back_to_yaml(self):
+        self.assertEqual(self.value(), 5)
+        with open(self.path + CACHE_SUFFIX, 'wb') as cache_file:
+            cache_file.write(b'\x80\x02not a pickle')
+
+        self.assertEqual(self.value(), 5)
+        #and the cache is written again
+        self.assertNotIn(b'not a pickle', open(self.path + CACHE_SUFFIX, 'rb').read())
+
+    def test_cache_of_older_format_falls_back_to_yaml(self):
+        self.assertEqual(self.value(), 5)
+        with open(self.path + CACHE_SUFFIX, 'rb') as cache_file:
+            cached = pickle.load(cache_file)
+        cached['key'] = (cached['key'][0] - 1,) + cached['key'][1:]
+        cached['params'] = None
+        with open(self.path + CACHE_SUFFIX, 'wb') as cache_file:
+            pickle.dump(cached, cache_file)
+
+        self.assertEqual(self.value(), 5)
+
+if __name__ == '__main__':
+    unittest.main()
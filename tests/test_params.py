@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+from struct import pack
+
+import support
+from param_manager import ParamManager
+from param_persister import ParamPersister
+
+_PARAMS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_params.yaml')
+
+class ParamSaveDelayTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.persister = ParamPersister(delay=60)
+
+    def tearDown(self):
+        self.persister.close()
+        shutil.rmtree(self.directory)
+
+    def _manager(self, name, save_delay):
+        path = os.path.join(self.directory, name)
+        shutil.copy(_PARAMS_FILE, path)
+        return (ParamManager(path, persister=self.persister, save_delay=save_delay), path)
+
+    @staticmethod
+    def _change(manager, name, value):
+        parameter = [parameter for parameter in manager.params.values() if parameter.name == name][0]
+        manager.change_params([pack('i', parameter.id), pack('i', value)])
+
+    def test_each_manager_keeps_its_own_delay(self):
+        (synchronous, synchronous_path) = self._manager('synchronous.yaml', 0)
+        (delayed, delayed_path) = self._manager('delayed.yaml', None)
+
+        self._change(delayed, 'test_param_1', 7)
+        self._change(synchronous, 'test_param_1', 8)
+
+        self.assertIn('value: 8', open(synchronous_path).read())
+        self.assertNotIn('value: 7', open(delayed_path).read())
+        self.assertEqual(self.persister.pending, 1)
+
+        self.persister.flush()
+        self.assertIn('value: 7', open(delayed_path).read())
+
+    def test_close_writes_pending_and_stops_writer(self):
+        (manager, path) = self._manager('closed.yaml', None)
+        self._change(manager, 'test_param_1', 9)
+        writer = self.persister._thread
+        self.assertTrue(writer.is_alive())
+
+        self.persister.close()
+        self.assertFalse(writer.is_alive())
+        self.assertIn('value: 9', open(path).read())
+
+        #saves after close are written right away
+        self._change(manager, 'test_param_1', 10)
+        self.assertIn('value: 10', open(path).read())
+        self.assertEqual(self.persister.pending, 0)
+
+if __name__ == '__main__':
+    unittest.main()
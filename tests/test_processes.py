@@ -0,0 +1,62 @@
+from struct import pack, unpack
+import unittest
+
+from tornado import ioloop
+
+import support
+from async_rnode import AsyncRNode
+from enums import DeviceType
+from executors import CallbackExecutor
+
+class Sample(object):
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+    def __init__(self, a=0):
+        self.A = a
+
+def double(request):
+    return Sample(request.A * 2)
+
+class MessengerProcessesTest(support.StubServerTestCase):
+    def test_request_is_served_by_worker(self):
+        node = self.create_node('ProcessNode')
+        node.def_service_msgr('Double', 'Dev', DeviceType.Nothing, Sample, Sample, double, processes=1)
+        self.start_node(node, 'ProcessNode', 2)
+
+        reply = self.server.request('ProcessNode', 'Double', [pack('i', 21)], timeout=5.0)
+        self.assertEqual(unpack('i', reply[0])[0], 42)
+
+    def test_define_after_start_is_refused(self):
+        node = self.create_node('ProcessNode')
+        self.start_node(node, 'ProcessNode', 1)
+
+        with self.assertRaises(Exception):
+            node.def_service_msgr('Double', 'Dev', DeviceType.Nothing, Sample, Sample, double, processes=1)
+        self.assertIsNone(node.get_defined_messenger('Double'))
+
+    def test_start_after_executor_threads_is_refused(self):
+        executor = CallbackExecutor(1)
+        try:
+            executor.submit(double, Sample(1)).result(1.0)
+
+            node = self.create_node('ProcessNode')
+            service = node.def_service_msgr('Double', 'Dev', DeviceType.Nothing, Sample, Sample, double, processes=1)
+            service.set_executor(executor)
+            with self.assertRaises(Exception):
+                node.start()
+        finally:
+            executor.shutdown()
+
+    def test_async_node_refuses_processes(self):
+        node = AsyncRNode('AsyncNode', io_loop=ioloop.IOLoop(),
+                          main_tcp_endpoint=self.main_endpoint, cmd_endpoint=self.cmd_endpoint)
+        try:
+            with self.assertRaises(Exception):
+                node.def_service_msgr('Double', 'Dev', DeviceType.Nothing, Sample, Sample, double, processes=1)
+            self.assertIsNone(node.get_defined_messenger('Double'))
+        finally:
+            node.close()
+
+if __name__ == '__main__':
+    unittest.main()
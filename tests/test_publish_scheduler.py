@@ -0,0 +1,94 @@
+import time
+import unittest
+
+import support
+from enums import OverrunPolicy
+from publish_scheduler import PeriodicTask, PublishScheduler
+
+class _Messenger(object):
+    def __init__(self):
+        self.name = 'Periodic'
+        self.is_active = True
+        self.sent = []
+
+    def send_reply(self, message):
+        self.sent.append(message)
+
+class OverrunPolicyTest(unittest.TestCase):
+    #a run scheduled at 1.0 finished at 1.055, five and a half periods later
+    def overrun(self, policy):
+        task = PeriodicTask(_Messenger(), 100, lambda: None, policy)
+        task.next_run = 1.0
+        task._schedule_next(1.055)
+        return task
+
+    def test_skip_stays_on_grid(self):
+        task = self.overrun(OverrunPolicy.Skip)
+
+        self.assertEqual(task.skipped, 5)
+        self.assertAlmostEqual(task.next_run, 1.06)
+
+    def test_catch_up_fires_missed_periods(self):
+        task = self.overrun(OverrunPolicy.CatchUp)
+
+        self.assertEqual(task.skipped, 0)
+        self.assertAlmostEqual(task.next_run, 1.01)
+
+    def test_reschedule_restarts_after_late_run(self):
+        task = self.overrun(OverrunPolicy.Reschedule)
+
+        self.assertEqual(task.skipped, 0)
+        self.assertAlmostEqual(task.next_run, 1.065)
+
+    def test_run_on_time_is_not_an_overrun(self):
+        for policy in OverrunPolicy:
+            task = PeriodicTask(_Messenger(), 100, lambda: None, policy)
+            task.next_run = 1.0
+            task._schedule_next(1.002)
+
+            self.assertEqual(task.skipped, 0)
+            self.assertAlmostEqual(task.next_run, 1.01)
+
+class PublishSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = PublishScheduler()
+        self.messenger = _Messenger()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def test_tasks_start_with_the_scheduler(self):
+        tasks = [self.scheduler.add(self.messenger, 100, lambda: 1, policy) for policy in OverrunPolicy]
+        #a slow node start between defining the tasks and starting them
+        time.sleep(0.2)
+        self.scheduler.start()
+        time.sleep(0.1)
+        self.scheduler.stop()
+
+        for task in tasks:
+            self.assertEqual(task.skipped, 0)
+            self.assertGreater(task.fired, 0)
+            #no catch-up burst for the time before start
+            self.assertLess(task.fired, 15)
+            self.assertLess(task.lateness.max, 0.05)
+
+    def test_inactive_topic_is_idle(self):
+        self.messenger.is_active = False
+        task = self.scheduler.add(self.messenger, 200, lambda: 1)
+        self.scheduler.start()
+
+        self.assertTrue(support.wait_until(lambda: task.idle >= 3))
+        self.assertEqual(self.messenger.sent, [])
+
+    def test_removed_task_stops(self):
+        self.scheduler.start()
+        task = self.scheduler.add(self.messenger, 200, lambda: 1)
+        self.assertTrue(support.wait_until(lambda: task.fired >= 2))
+
+        self.scheduler.remove(task)
+        fired = task.fired
+        time.sleep(0.05)
+        self.assertLessEqual(task.fired, fired + 1)
+
+if __name__ == '__main__':
+    unittest.main()
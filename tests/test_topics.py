@@ -0,0 +1,138 @@
+from struct import pack, unpack
+import unittest
+
+import support
+import messaging
+from enums import DeviceType, SendStatus
+
+class Sample(object):
+    __slots__ = ['A']
+    _slot_types = ['int32']
+
+    def __init__(self, a=0):
+        self.A = a
+
+class TopicTestCase(support.StubServerTestCase):
+    def setUp(self):
+        super(TopicTestCase, self).setUp()
+        self.published = []
+        self.server.on_publish(lambda node, messenger, message, received_at:
+                               self.published.append((messenger.name, unpack('i', message[0])[0])))
+
+    def values(self, name):
+        return [value for (messenger, value) in self.published if messenger == name]
+
+class BatchingTest(TopicTestCase):
+    def test_full_batches_are_sent_together(self):
+        node = self.create_node('BatchNode')
+        topic = node.def_topic_msgr('Batched', 'Dev', DeviceType.Nothing, Sample, batch_size=4, batch_window=10.0)
+        self.start_node(node, 'BatchNode', 2)
+
+        statuses = [topic.send_reply(Sample(i)) for i in range(8)]
+
+        self.assertEqual(statuses, [SendStatus.Queued] * 8)
+        self.assertTrue(support.wait_until(lambda: len(self.values('Batched')) == 8))
+        self.assertEqual(self.values('Batched'), range(8))
+        self.assertEqual(self.server.nodes['BatchNode'].messenger('Batched').batches, 2)
+
+    def test_window_flushes_partial_batch(self):
+        node = self.create_node('BatchNode')
+        topic = node.def_topic_msgr('Batched', 'Dev', DeviceType.Nothing, Sample, batch_size=10, batch_window=0.01)
+        self.start_node(node, 'BatchNode', 2)
+
+        topic.send_reply(Sample(7))
+        self.assertTrue(support.wait_until(lambda: self.values('Batched') == [7]))
+
+    def test_service_replies_are_not_batched(self):
+        node = self.create_node('BatchNode')
+        service = node.def_service_msgr('Echo', 'Dev', DeviceType.Nothing, Sample, Sample, lambda request: request)
+        self.start_node(node, 'BatchNode', 2)
+
+        self.assertEqual(service.batch_size, 0)
+        self.assertTrue(service.is_active)
+        reply = self.server.request('BatchNode', 'Echo', [pack('i', 5)])
+        self.assertEqual(unpack('i', reply[0])[0], 5)
+        self.assertNotEqual(service.send_reply(Sample(6)), SendStatus.Suppressed)
+
+class ChangeFilterTest(TopicTestCase):
+    def setUp(self):
+        super(ChangeFilterTest, self).setUp()
+        self.node = self.create_node('FilterNode')
+        self.topic = self.node.def_topic_msgr('Filtered', 'Dev', DeviceType.Nothing, Sample)
+        self.start_node(self.node, 'FilterNode', 2)
+
+    def send(self, values):
+        return [self.topic.send_reply(Sample(value)) for value in values]
+
+    def published_after(self, last):
+        self.assertTrue(support.wait_until(lambda: self.values('Filtered')[-1:] == [last]))
+        return self.values('Filtered')
+
+    def test_unchanged_messages_are_suppressed(self):
+        self.topic.set_change_filter()
+        statuses = self.send([1, 1, 2])
+
+        self.assertEqual(statuses, [SendStatus.Queued, SendStatus.Suppressed, SendStatus.Queued])
+        self.assertEqual(self.published_after(2), [1, 2])
+        self.assertEqual(self.topic.metrics.suppressed, 1)
+
+    def test_deadband_compares_with_last_sent(self):
+        self.topic.set_change_filter(deadbands={'A': 2})
+        self.send([10, 11, 12, 13])
+
+        self.assertEqual(self.published_after(13), [10, 13])
+
+    def test_keep_alive_uses_monotonic_clock(self):
+        clock = [100.0]
+        original = messaging.monotonic
+        messaging.monotonic = lambda: clock[0]
+        try:
+            self.topic.set_change_filter(keep_alive=1.0)
+            self.send([5, 5])
+            clock[0] += 1.5
+            self.send([5])
+        finally:
+            messaging.monotonic = original
+
+        self.assertTrue(support.wait_until(lambda: len(self.values('Filtered')) == 2))
+        self.assertEqual(self.values('Filtered'), [5, 5])
+
+class InterestTest(TopicTestCase):
+    def setUp(self):
+        super(InterestTest, self).setUp()
+        self.changes = []
+        self.node = self.create_node('InterestNode', on_demand=True)
+        self.topic = self.node.def_topic_msgr('Watched', 'Dev', DeviceType.Nothing, Sample)
+        self.topic.set_active_callback(self.changes.append)
+        self.start_node(self.node, 'InterestNode', 2)
+        self.assertTrue(support.wait_until(lambda: not self.topic.is_active))
+
+    def test_topic_without_listeners_is_suppressed(self):
+        self.assertEqual(self.topic.send_reply(Sample(1)), SendStatus.Suppressed)
+
+        self.server.listen('InterestNode', 'Watched')
+        self.assertTrue(support.wait_until(lambda: self.topic.is_active))
+        self.topic.send_reply(Sample(2))
+        self.assertTrue(support.wait_until(lambda: self.values('Watched') == [2]))
+
+        self.server.unlisten('InterestNode', 'Watched')
+        self.assertTrue(support.wait_until(lambda: not self.topic.is_active))
+        self.assertEqual(self.changes, [False, True, False])
+
+    def test_new_listener_gets_unchanged_message(self):
+        self.topic.set_change_filter()
+        self.server.listen('InterestNode', 'Watched')
+        self.assertTrue(support.wait_until(lambda: self.topic.is_active))
+        self.topic.send_reply(Sample(3))
+        self.assertTrue(support.wait_until(lambda: self.values('Watched') == [3]))
+
+        self.server.unlisten('InterestNode', 'Watched')
+        self.assertTrue(support.wait_until(lambda: not self.topic.is_active))
+        self.server.listen('InterestNode', 'Watched')
+        self.assertTrue(support.wait_until(lambda: self.topic.is_active))
+
+        self.assertNotEqual(self.topic.send_reply(Sample(3)), SendStatus.Suppressed)
+        self.assertTrue(support.wait_until(lambda: self.values('Watched') == [3, 3]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+from enums import DeviceType, MessageValueType, SendStatus
+from param_manager import ParamManager
+
+class Blob(object):
+    __slots__ = ['data']
+    _slot_types = ['raw']
+
+    def __init__(self, data=b''):
+        self.data = data
+
+class ZeroCopyReceiveTest(support.StubServerTestCase):
+    def setUp(self):
+        super(ZeroCopyReceiveTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'raw.yaml')
+        with open(self.path, 'w') as params_file:
+            params_file.write('blob:\n  description: raw parameter\n  flags: 0\n  type: raw\n  value: none\n')
+
+    def tearDown(self):
+        super(ZeroCopyReceiveTest, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_large_request_field_is_not_copied(self):
+        received = []
+        node = self.create_node('ZeroCopyNode', zero_copy=True)
+        node.def_service_msgr('Echo', 'Dev', DeviceType.Nothing, Blob, Blob,
+                              lambda request: received.append(type(request.data)) or request)
+        self.start_node(node, 'ZeroCopyNode', 2)
+        blob = b'\x02' * 300
+
+        reply = self.server.request('ZeroCopyNode', 'Echo', [blob])
+        self.assertEqual(reply, [blob])
+        self.assertEqual(received, [memoryview])
+
+    def test_large_raw_parameter_is_saved_as_bytes(self):
+        node = self.create_node('ZeroCopyNode', zero_copy=True, param_in=self.path, param_save_delay=0)
+        self.start_node(node, 'ZeroCopyNode', 1)
+        blob = b'\x01' * 300
+
+        self.server.change_params('ZeroCopyNode', [(0, blob)])
+        self.assertTrue(support.wait_until(lambda: node.get_param(0) == blob))
+        self.assertIs(type(node.get_param(0)), bytes)
+
+        reloaded = ParamManager(self.path)
+        self.assertEqual(reloaded.params[0].type, MessageValueType.raw)
+        self.assertEqual(reloaded.params[0].value, blob)
+
+class ZeroCopySendTest(support.StubServerTestCase):
+    def test_pooled_buffer_returns_after_send(self):
+        node = self.create_node('ZeroCopyNode')
+        raw = node.def_raw_msgr('Raw', 'Dev', DeviceType.Nothing, zero_copy=True)
+        self.start_node(node, 'ZeroCopyNode', 2)
+
+        payload = b'\x03' * 300
+        buffer = raw.acquire_buffer(len(payload))
+        buffer[:len(payload)] = payload
+        self.assertEqual(raw.send_buffer(buffer, len(payload)), SendStatus.Queued)
+
+        raw_messages = self.server.nodes['ZeroCopyNode'].raw_messages
+        self.assertTrue(support.wait_until(lambda: raw_messages))
+        self.assertEqual(raw_messages[0], [payload])
+        self.assertTrue(support.wait_until(lambda: raw.acquire_buffer(len(payload)) is buffer))
+
+    def test_send_reply_returns_status(self):
+        node = self.create_node('ZeroCopyNode')
+        raw = node.def_raw_msgr('Raw', 'Dev', DeviceType.Nothing, zero_copy=True)
+        self.start_node(node, 'ZeroCopyNode', 2)
+
+        self.assertEqual(raw.send_reply(b'\x04' * 300), SendStatus.Queued)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 from __future__ import print_function
 from itertools import izip
 import sys
+import time
 
 def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
@@ -12,6 +13,41 @@ def static_vars(**kwargs):
         return func
     return decorate
 
+#python 2 has no monotonic clock, on linux CLOCK_MONOTONIC is read through libc
+def _libc_monotonic():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('rt') or 'libc.so.6', use_errno=True)
+        clock_gettime = libc.clock_gettime
+    except (OSError, AttributeError):
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    #ctypes releases the GIL during the call, so every call fills its own timespec
+    def monotonic():
+        value = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(value)):
+            raise OSError(ctypes.get_errno(), 'clock_gettime failed')
+        return value.tv_sec + value.tv_nsec * 1e-9
+    return monotonic
+
+try:
+    from time import monotonic
+except ImportError:
+    monotonic = _libc_monotonic() or time.time
+
+def is_future(obj):
+    return hasattr(obj, 'add_done_callback')
+
 def grouped(iterable, n):
     return izip(*[iter(iterable)] * n)
 